@@ -0,0 +1,86 @@
+from array import array
+
+import rollup
+
+# Поля строки: метрики отчёта и число смен
+FIELDS = rollup.METRICS + ["Смен"]
+_WIDTH = len(FIELDS)
+
+
+# ────────────────────────────────────────────────
+# Оперативные итоги месяца по Telegram ID
+# ────────────────────────────────────────────────
+class MonthAggregates:
+    """
+    Итоги текущего месяца в памяти: у каждого пользователя — строка фиксированной
+    ширины в одном массиве array('d'), плюс строка общих итогов, которая
+    пополняется вместе с ней. Ключ — rollup.user_key(): Telegram ID, для старых
+    записей без ID — имя; отображаемые имена — в отдельном словаре.
+    • add() и totals() — O(1): подвал подтверждения не пересчитывает всех;
+    • user_stats() — O(пользователей), формат user_stats для /stats.
+    """
+
+    def __init__(self):
+        self._slots: dict[str, int] = {}  # ключ → номер строки в _data
+        self._keys: list[str] = []
+        self._names: dict[str, str] = {}
+        self._data = array("d")
+        self._totals = array("d", [0.0] * _WIDTH)
+
+    def __len__(self) -> int:
+        return len(self._keys)
+
+    def clear(self):
+        self._slots.clear()
+        self._keys.clear()
+        self._names.clear()
+        self._data = array("d")
+        self._totals = array("d", [0.0] * _WIDTH)
+
+    def _slot(self, key: str) -> int:
+        slot = self._slots.get(key)
+        if slot is None:
+            slot = self._slots[key] = len(self._keys)
+            self._keys.append(key)
+            self._data.extend([0.0] * _WIDTH)
+        return slot * _WIDTH
+
+    def add(self, user_id: int | None, name: str, values: dict, shifts: int = 1):
+        """Учитывает отчёт пользователя (имя обновляется на последнее)."""
+        key = rollup.user_key(name, user_id)
+        if key.startswith(rollup.ID_PREFIX):
+            self._names[key] = name
+        base = self._slot(key)
+        for i, k in enumerate(rollup.METRICS):
+            v = values.get(k, 0.0)
+            if isinstance(v, (int, float)):
+                self._data[base + i] += v
+                self._totals[i] += v
+        self._data[base + _WIDTH - 1] += shifts
+        self._totals[_WIDTH - 1] += shifts
+
+    def load(self, totals: dict, names: dict):
+        """Заменяет итоги загруженными из хранилища: ({ключ: ячейка}, {ключ: имя})."""
+        self.clear()
+        self._names.update(names)
+        for key, cell in totals.items():
+            base = self._slot(key)
+            for i, k in enumerate(FIELDS):
+                v = float(cell.get(k, 0) or 0)
+                self._data[base + i] = v
+                self._totals[i] += v
+
+    def totals(self) -> dict:
+        """Общие итоги месяца по всем пользователям."""
+        out = dict(zip(FIELDS, self._totals))
+        out["Смен"] = int(out["Смен"])
+        return out
+
+    def user_stats(self) -> dict:
+        """Итоги по пользователям в формате user_stats (тёзки различаются по ID)."""
+        totals = {}
+        for key, slot in self._slots.items():
+            cell = dict(zip(FIELDS, self._data[slot * _WIDTH:(slot + 1) * _WIDTH]))
+            cell["Смен"] = int(cell["Смен"])
+            totals[key] = cell
+        return rollup.display_totals(totals, self._names)
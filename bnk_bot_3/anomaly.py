@@ -0,0 +1,111 @@
+import json
+import math
+import os
+import threading
+
+# ──────────────────────────────────────────────────────────────────────────────
+# Необычные смены: потоковая статистика долей отходов
+# ──────────────────────────────────────────────────────────────────────────────
+# На каждый ряд (доля отходов, доля экструзии) у каждого пользователя и у цеха
+# в целом хранится [n, среднее, M2, EWMA]: среднее и дисперсия — по Уэлфорду,
+# EWMA — текущий уровень (следит за медленным дрейфом). Отчёт сравнивается со
+# значениями ДО его учёта: z = (x − EWMA) / σ. Обновление и проверка — O(1),
+# историю отчётов никто не перечитывает. Состояние лежит рядом с данными
+# раздела в anomaly.json.
+
+# ряд → (числитель, знаменатель) из значений отчёта
+SERIES = {
+    "Доля отходов": ("Итого", "Вес"),
+    "Доля экструзии": ("Экструзия", "Вес"),
+}
+HALL_KEY = "*"  # итоговая статистика цеха
+
+
+def _update(st: list, x: float, alpha: float):
+    n = st[0] + 1
+    delta = x - st[1]
+    mean = st[1] + delta / n
+    st[2] += delta * (x - mean)
+    st[0], st[1] = n, mean
+    st[3] = x if n == 1 else alpha * x + (1 - alpha) * st[3]
+
+
+class AnomalyDetector:
+    """
+    observe() проверяет отчёт и учитывает его. Пользователь сравнивается со своей
+    историей, а пока у него меньше `warmup` смен — с историей цеха. Необычно —
+    |z| ≥ threshold (threshold 0 — проверка выключена, статистика всё равно копится).
+    """
+
+    def __init__(self, path: str, threshold: float = 3.0, warmup: int = 10, alpha: float = 0.2):
+        self.path = path
+        self.threshold = threshold
+        self.warmup = max(warmup, 2)
+        self.alpha = alpha
+        self._state: dict[str, dict[str, list]] = {}  # ключ пользователя → ряд → [n, среднее, M2, EWMA]
+        self._dirty = False
+        self._lock = threading.Lock()  # save() идёт в потоке, observe() — в event loop
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                self._state = json.load(f).get("state", {})
+        except (OSError, ValueError, AttributeError):
+            self._state = {}
+
+    def _score(self, st: list | None, x: float) -> tuple[float, float, float] | None:
+        """(z, уровень, σ) или None — истории мало или она без разброса."""
+        if st is None or st[0] < self.warmup:
+            return None
+        std = math.sqrt(st[2] / (st[0] - 1))
+        if std <= 0:
+            return None
+        return (x - st[3]) / std, st[3], std
+
+    def observe(self, key: str, values: dict) -> list[tuple]:
+        """
+        Учитывает отчёт пользователя `key` (см. rollup.user_key) и возвращает
+        необычные ряды: [(ряд, значение, по цеху?, z, уровень, σ), ...].
+        """
+        out = []
+        with self._lock:
+            user = self._state.setdefault(key, {})
+            hall = self._state.setdefault(HALL_KEY, {})
+            for name, (num, den) in SERIES.items():
+                try:
+                    denominator = float(values.get(den, 0) or 0)
+                    x = float(values.get(num, 0) or 0) / denominator if denominator > 0 else None
+                except (TypeError, ValueError):
+                    x = None
+                if x is None:
+                    continue  # без веса долю не посчитать
+
+                score = self._score(user.get(name), x)
+                by_hall = score is None
+                if by_hall:
+                    score = self._score(hall.get(name), x)
+                if score is not None and self.threshold > 0 and abs(score[0]) >= self.threshold:
+                    out.append((name, x, by_hall) + score)
+
+                _update(user.setdefault(name, [0, 0.0, 0.0, 0.0]), x, self.alpha)
+                _update(hall.setdefault(name, [0, 0.0, 0.0, 0.0]), x, self.alpha)
+            self._dirty = True
+        return out
+
+    def save(self):
+        """Сохраняет состояние, если оно менялось (по таймеру и при остановке)."""
+        with self._lock:  # файл маленький (ряды × пользователи) — пишем прямо под блокировкой
+            if not self._dirty:
+                return
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            tmp_path = self.path + ".tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump({"alpha": self.alpha, "state": self._state}, f, ensure_ascii=False, separators=(",", ":"))
+            os.replace(tmp_path, self.path)
+            self._dirty = False
+
+
+def describe(anomaly: tuple, username: str) -> str:
+    """Строка предупреждения для подтверждения отчёта."""
+    name, x, by_hall, z, level, std = anomaly
+    direction = "выше" if z > 0 else "ниже"
+    whose = "по цеху" if by_hall else f"у {username}"
+    return f"⚠️ {name} {x:.1%} — заметно {direction} обычного {whose} (обычно {level:.1%} ± {std:.1%})"
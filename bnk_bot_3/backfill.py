@@ -0,0 +1,165 @@
+"""
+Импорт истории отчётов из экспорта чата Telegram Desktop (JSON).
+
+    python3 /app/backfill.py /config/export/result.json [--data-dir DIR] [--chat CHAT_ID] [--dry-run]
+
+Экспорт читается потоково (память не зависит от размера файла). Каждое
+сообщение проходит те же правила, что и в боте (build_report: фильтр ключевых
+слов, минимум 3 поля, Итого), и записывается в месяц по дате сообщения.
+Записи копятся только для текущего месяца экспорта: при смене месяца он
+пишется в хранилище одним пакетом, а его Excel собирается один раз.
+Повторный запуск на том же экспорте добавит записи повторно.
+При CHAT_PARTITIONS история цеха пишется в его раздел: --chat <ID чата>
+(для основного чата, PRIMARY_CHAT_ID, не указывается).
+Запускать можно при работающем боте: месяц пишется под той же блокировкой
+файла, что и у бота (см. excel_store.ExcelStorage._locked). Итоги текущего
+месяца в памяти бота пополнятся после его перезапуска.
+"""
+import argparse
+import json
+import re
+import sys
+import time
+from datetime import datetime
+
+import data_utils
+from parser import build_report
+
+_MESSAGES_START_RE = re.compile(r'(?<!\\)"messages"\s*:\s*\[')
+_SEPARATORS = " \t\r\n,"
+
+
+def iter_export_messages(path: str, chunk_size: int = 1 << 20):
+    """
+    Потоково отдаёт объекты из массива "messages" экспорта одного чата
+    (result.json из Telegram Desktop), не загружая файл целиком.
+    """
+    decoder = json.JSONDecoder()
+    with open(path, "r", encoding="utf-8") as f:
+        buf = ""
+        # 1) ищем начало массива messages
+        while True:
+            chunk = f.read(chunk_size)
+            if not chunk:
+                return
+            buf += chunk
+            m = _MESSAGES_START_RE.search(buf)
+            if m:
+                buf = buf[m.end():]
+                break
+            buf = buf[-64:]  # хвост на случай, если ключ разрезан на границе чанков
+
+        # 2) разбираем элементы массива по одному
+        pos = 0
+        eof = False
+        while True:
+            while pos < len(buf) and buf[pos] in _SEPARATORS:
+                pos += 1
+            if pos < len(buf) and buf[pos] == "]":
+                return
+            try:
+                if pos >= len(buf):
+                    raise ValueError("buffer exhausted")
+                obj, pos = decoder.raw_decode(buf, pos)
+            except ValueError:
+                if eof:
+                    raise ValueError(f"{path}: обрыв JSON внутри массива messages")
+                chunk = f.read(chunk_size)
+                eof = not chunk
+                buf = buf[pos:] + chunk
+                pos = 0
+                continue
+            yield obj
+
+
+def message_text(msg: dict) -> str:
+    """Текст сообщения экспорта: строка или список фрагментов (строки и {"text": …})."""
+    text = msg.get("text", "")
+    if isinstance(text, list):
+        return "".join(part if isinstance(part, str) else str(part.get("text", "")) for part in text)
+    return text or ""
+
+
+def message_user_id(msg: dict) -> int | None:
+    """Telegram ID автора: в экспорте поле from_id вида "user123456" (у каналов — "channel…")."""
+    from_id = str(msg.get("from_id") or "")
+    if from_id.startswith("user") and from_id[4:].isdigit():
+        return int(from_id[4:])
+    return None
+
+
+def backfill(path: str, full_names: bool = False, dry_run: bool = False, progress_every: int = 50_000,
+             partition: str | None = None) -> dict:
+    scanned = reports = 0
+    month_rows: list[tuple] = []
+    month = None
+    written: dict[str, int] = {}
+    started = time.perf_counter()
+
+    def flush():
+        if not month_rows:
+            return
+        if not dry_run:
+            data_utils.save_entries(month_rows, partition)
+            data_utils.settle_month(month, partition)
+        written[month] = written.get(month, 0) + len(month_rows)
+        print(f"  {month}: {len(month_rows)} отчётов")
+        month_rows.clear()
+
+    for msg in iter_export_messages(path):
+        scanned += 1
+        if scanned % progress_every == 0:
+            rate = scanned / (time.perf_counter() - started)
+            print(f"… {scanned} сообщений, {reports} отчётов ({rate:,.0f} сообщ/с)")
+
+        if msg.get("type") != "message":
+            continue
+        values = build_report(message_text(msg))
+        if values is None:
+            continue
+        try:
+            date = datetime.fromisoformat(msg["date"])
+        except (KeyError, TypeError, ValueError):
+            continue
+
+        user = str(msg.get("from") or "").strip() or "?"
+        if not full_names:
+            user = user.split()[0]  # бот сохраняет first_name
+
+        ym = date.strftime('%Y-%m')
+        if ym != month:
+            flush()
+            month = ym
+        month_rows.append((date, user, values, message_user_id(msg)))
+        reports += 1
+
+    flush()
+
+    elapsed = time.perf_counter() - started
+    return {"scanned": scanned, "reports": reports, "months": written, "seconds": elapsed}
+
+
+def main() -> int:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("export", help="result.json из Telegram Desktop (экспорт одного чата в JSON)")
+    ap.add_argument("--data-dir", help=f"каталог данных (по умолчанию {data_utils.DATA_DIR})")
+    ap.add_argument("--full-names", action="store_true", help="сохранять полное имя автора, а не только первое слово")
+    ap.add_argument("--chat", type=int, help="ID чата цеха — писать в его раздел (при CHAT_PARTITIONS)")
+    ap.add_argument("--dry-run", action="store_true", help="только разобрать и посчитать, ничего не записывать")
+    args = ap.parse_args()
+
+    if args.data_dir:
+        data_utils.set_data_dir(args.data_dir)
+
+    partition = str(args.chat) if args.chat is not None else None
+    result = backfill(args.export, full_names=args.full_names, dry_run=args.dry_run, partition=partition)
+    rate = result["scanned"] / result["seconds"] if result["seconds"] else 0.0
+    print(
+        f"Готово: {result['scanned']} сообщений, {result['reports']} отчётов, "
+        f"{len(result['months'])} месяцев за {result['seconds']:.1f} с ({rate:,.0f} сообщ/с)"
+    )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
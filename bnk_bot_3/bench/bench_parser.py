@@ -0,0 +1,204 @@
+"""
+Бенчмарк и «золотой» корпус для parser.parse_message.
+
+    python3 bench/bench_parser.py                    # проверка + замер
+    python3 bench/bench_parser.py --update-baseline  # записать текущую скорость как эталон этого хоста
+    python3 bench/bench_parser.py --update-golden    # пересохранить ожидаемые ответы (осознанно!)
+
+Падает (код 1), если хоть один ответ отличается от корпуса или если
+пропускная способность упала больше, чем на --threshold относительно эталона.
+Эталон скорости зависит от машины, поэтому хранится по хостам (архитектура,
+процессор, число ядер, версия Python): на хосте без эталона скорость только
+печатается — запишите его там через --update-baseline.
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import sys
+import time
+import tracemalloc
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(HERE))
+
+import parser as parser_module  # noqa: E402
+from parser import parse_message  # noqa: E402
+
+CORPUS_PATH = os.path.join(HERE, "parser_corpus.json")
+BASELINE_PATH = os.path.join(HERE, "parser_baseline.json")
+
+
+def host_id() -> str:
+    """Ключ эталона скорости: архитектура, модель процессора, ядра, версия Python."""
+    cpu = platform.processor()
+    try:
+        with open("/proc/cpuinfo", "r", encoding="utf-8") as f:
+            for line in f:
+                key, _, value = line.partition(":")
+                # x86 — "model name", ARM (Raspberry Pi) — "Model" / "Hardware"
+                if key.strip() in ("model name", "Model", "Hardware") and value.strip():
+                    cpu = value.strip()
+                    break
+    except OSError:
+        pass
+    return f"{platform.machine()} | {cpu or '?'} | {os.cpu_count()} CPU | Python {platform.python_version()}"
+
+
+def load_baselines() -> dict:
+    """Эталоны по хостам; файл старого формата (без хоста) не считается ничьим."""
+    if not os.path.exists(BASELINE_PATH):
+        return {}
+    with open(BASELINE_PATH, "r", encoding="utf-8") as f:
+        return json.load(f).get("hosts", {})
+
+
+def load_corpus() -> list[dict]:
+    with open(CORPUS_PATH, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def check_golden(corpus: list[dict]) -> list[str]:
+    """Сверка с ожидаемыми ответами; возвращает список расхождений."""
+    errors = []
+    for case in corpus:
+        got = parse_message(case["text"])
+        if got != case["expected"]:
+            errors.append(f"{case['name']}: ожидалось {case['expected']}, получено {got}")
+    return errors
+
+
+def measure_throughput(texts: list[str], seconds: float, repeats: int = 5) -> float:
+    """
+    Сообщений в секунду: корпус гоняется по кругу `repeats` раз по seconds/repeats,
+    берётся лучший замер — так меньше шума от соседей по хосту.
+    """
+    best = 0.0
+    for _ in range(repeats):
+        n = 0
+        start = time.perf_counter()
+        deadline = start + seconds / repeats
+        while True:
+            for t in texts:
+                parse_message(t)
+            n += len(texts)
+            now = time.perf_counter()
+            if now >= deadline:
+                break
+        best = max(best, n / (now - start))
+    return best
+
+
+def measure_latency(texts: list[str], rounds: int) -> tuple[float, float]:
+    """p50 / p99 времени разбора одного сообщения, мкс."""
+    samples = []
+    clock = time.perf_counter_ns
+    for _ in range(rounds):
+        for t in texts:
+            t0 = clock()
+            parse_message(t)
+            samples.append((clock() - t0) / 1000)
+    samples.sort()
+    p99 = samples[min(len(samples) - 1, int(len(samples) * 0.99))]
+    return statistics.median(samples), p99
+
+
+def measure_allocations(texts: list[str]) -> tuple[float, float, int]:
+    """
+    Память на сообщение по tracemalloc: средний пик (байт), блоков, выделенных
+    в parser.py на одно сообщение и живых после разбора (по статистике снимка,
+    пока результаты не освобождены), и число блоков, оставшихся живыми после
+    всего прогона (должно быть ~0 — утечек нет).
+    """
+    for t in texts:  # прогрев кэшей модуля до замера
+        parse_message(t)
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    peaks = []
+    for t in texts:
+        tracemalloc.reset_peak()
+        base, _ = tracemalloc.get_traced_memory()
+        parse_message(t)
+        _, peak = tracemalloc.get_traced_memory()
+        peaks.append(peak - base)
+    after = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+    leaked = _parser_blocks(after, before)
+
+    # блоки — отдельным прогоном: освобождённые разом результаты оседают в
+    # free list'ах интерпретатора и исказили бы счёт утечек выше
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    results = [parse_message(t) for t in texts]
+    held = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+    del results
+    return statistics.mean(peaks), _parser_blocks(held, before) / len(texts), leaked
+
+
+def _parser_blocks(snapshot, before) -> int:
+    """Прирост числа блоков, выделенных в parser.py, между снимками (statistics по файлам)."""
+    return sum(
+        stat.count_diff
+        for stat in snapshot.compare_to(before, "filename")
+        if stat.traceback[0].filename == parser_module.__file__
+    )
+
+
+def main() -> int:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--seconds", type=float, default=3.0, help="длительность замера пропускной способности")
+    ap.add_argument("--rounds", type=int, default=200, help="проходов корпуса для замера задержек")
+    ap.add_argument("--threshold", type=float, default=0.20, help="допустимое падение скорости (доля)")
+    ap.add_argument("--update-baseline", action="store_true")
+    ap.add_argument("--update-golden", action="store_true")
+    args = ap.parse_args()
+
+    corpus = load_corpus()
+    texts = [c["text"] for c in corpus]
+
+    if args.update_golden:
+        for case in corpus:
+            case["expected"] = parse_message(case["text"])
+        with open(CORPUS_PATH, "w", encoding="utf-8") as f:
+            json.dump(corpus, f, ensure_ascii=False, indent=2)
+        print(f"Корпус обновлён: {len(corpus)} сообщений")
+
+    errors = check_golden(corpus)
+    for e in errors:
+        print(f"[FAIL] {e}")
+    print(f"Корпус: {len(corpus) - len(errors)}/{len(corpus)} совпадений")
+
+    rate = measure_throughput(texts, args.seconds)
+    p50, p99 = measure_latency(texts, args.rounds)
+    peak, blocks, leaked = measure_allocations(texts)
+    print(f"Пропускная способность: {rate:,.0f} сообщ/с")
+    print(f"Задержка на сообщение: p50 {p50:.1f} мкс, p99 {p99:.1f} мкс")
+    print(f"Память: пик {peak / 1024:.1f} КиБ на сообщение, выделено блоков на сообщение {blocks:.1f}, "
+          f"неосвобождённых блоков {leaked}")
+
+    failed = bool(errors)
+
+    host = host_id()
+    baselines = load_baselines()
+    if args.update_baseline:
+        baselines[host] = {"msgs_per_sec": round(rate)}
+        with open(BASELINE_PATH, "w", encoding="utf-8") as f:
+            json.dump({"hosts": baselines}, f, ensure_ascii=False, indent=2)
+        print(f"Эталон скорости записан для {host}: {rate:,.0f} сообщ/с")
+    elif host not in baselines:
+        print(f"Эталона для этого хоста нет ({host}) — скорость не сверяется, запишите его через --update-baseline")
+    else:
+        baseline = baselines[host]["msgs_per_sec"]
+        drop = 1 - rate / baseline
+        print(f"Эталон: {baseline:,.0f} сообщ/с ({-drop:+.1%})")
+        if drop > args.threshold:
+            print(f"[FAIL] скорость упала на {drop:.1%} (допустимо {args.threshold:.0%})")
+            failed = True
+
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,117 @@
+"""
+Сквозной замер «обновление → ответ бота» в режимах polling и webhook.
+
+    python3 bench/bench_updates.py                   # оба режима, по 200 запросов
+    python3 bench/bench_updates.py --mode webhook --rounds 500
+
+Бот (main.build_application) поднимается целиком, но ходит не в Telegram,
+а в локальный fake_bot_api.FakeBotApi (через BOT_API_URL). Каждое обновление —
+команда /myid в личке; задержка считается от момента, когда обновление отдано
+боту (ответ на getUpdates / POST на webhook), до прихода его sendMessage.
+Падает (код 1), если хоть один ответ не пришёл или пришёл не тот.
+Данные бота пишутся во временный каталог.
+"""
+import argparse
+import asyncio
+import os
+import socket
+import statistics
+import sys
+import tempfile
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(HERE))
+sys.path.insert(0, HERE)
+
+from fake_bot_api import FakeBotApi  # noqa: E402
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+async def _run_mode(main, api: FakeBotApi, mode: str, rounds: int, warmup: int) -> list[float] | None:
+    app = main.build_application()
+    await app.initialize()
+    await app.start()
+    if mode == "webhook":
+        port = _free_port()
+        await app.updater.start_webhook(
+            listen="127.0.0.1",
+            port=port,
+            url_path=main.WEBHOOK_PATH,
+            secret_token=main.WEBHOOK_SECRET,
+            webhook_url=f"http://127.0.0.1:{port}/{main.WEBHOOK_PATH}",
+        )
+    else:
+        await app.updater.start_polling(poll_interval=0.0, timeout=10)
+
+    latencies = []
+    try:
+        for i in range(warmup + rounds):
+            update = api.make_update("/myid", user_id=1000 + i)
+            sent = time.perf_counter()
+            if mode == "webhook":
+                await api.deliver_update(update)
+            else:
+                api.push_update(update)
+            try:
+                got, method, params = await asyncio.wait_for(api.replies.get(), 10)
+            except asyncio.TimeoutError:
+                print(f"[FAIL] {mode}: нет ответа на обновление {update['update_id']}")
+                return None
+            if method != "sendmessage" or str(1000 + i) not in params.get("text", ""):
+                print(f"[FAIL] {mode}: неожиданный ответ {method} {params}")
+                return None
+            if i >= warmup:
+                latencies.append((got - sent) * 1000)
+    finally:
+        await app.updater.stop()
+        await app.stop()
+        await app.shutdown()
+    return latencies
+
+
+def _report(mode: str, ms: list[float]):
+    q = statistics.quantiles(ms, n=100)
+    print(f"{mode:8s} n={len(ms):4d}  p50 {q[49]:6.2f} мс  p95 {q[94]:6.2f} мс  "
+          f"p99 {q[98]:6.2f} мс  среднее {statistics.fmean(ms):6.2f} мс")
+
+
+async def _amain(args) -> int:
+    api = FakeBotApi()
+    await api.start()
+    os.environ["BOT_API_URL"] = api.url
+    os.environ.setdefault("TELEGRAM_TOKEN", "123456:bench")
+
+    import data_utils
+
+    data_utils.set_data_dir(tempfile.mkdtemp(prefix="bnk_bench_"))
+    import main  # после выбора каталога данных: main берёт DATA_DIR при импорте
+
+    failed = False
+    try:
+        for mode in (["polling", "webhook"] if args.mode == "both" else [args.mode]):
+            ms = await _run_mode(main, api, mode, args.rounds, args.warmup)
+            if ms is None:
+                failed = True
+                continue
+            _report(mode, ms)
+    finally:
+        await api.close()
+    return 1 if failed else 0
+
+
+def main() -> int:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--mode", choices=["polling", "webhook", "both"], default="both")
+    ap.add_argument("--rounds", type=int, default=200, help="замеряемых обновлений на режим")
+    ap.add_argument("--warmup", type=int, default=20, help="обновлений на прогрев (не учитываются)")
+    return asyncio.run(_amain(ap.parse_args()))
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,169 @@
+"""
+Минимальный локальный Bot API для бенчмарков и сквозных проверок бота.
+
+Понимает то, что бот вызывает при старте и в ответах (getMe, setMyCommands,
+deleteWebhook/setWebhook, getUpdates с long polling, sendMessage и пр.),
+и умеет доставлять обновления обоими способами:
+  • push_update()    — в очередь getUpdates (режим polling);
+  • deliver_update() — POST на зарегистрированный webhook (режим webhook).
+Каждый ответ бота (send*) кладётся в replies вместе с моментом получения.
+Бот подключается через BOT_API_URL=http://127.0.0.1:<port>.
+"""
+import asyncio
+import json
+import time
+from urllib.parse import parse_qsl
+
+BOT_USER = {
+    "id": 1,
+    "is_bot": True,
+    "first_name": "BNK",
+    "username": "bnk_bench_bot",
+    "can_join_groups": True,
+    "can_read_all_group_messages": True,
+    "supports_inline_queries": False,
+}
+
+
+def _multipart_fields(body: bytes, ctype: str) -> dict:
+    """Текстовые поля multipart/form-data (файлы пропускаются) — для sendDocument/sendMediaGroup."""
+    boundary = ctype.split("boundary=", 1)[-1].strip('"').encode()
+    fields = {}
+    for part in body.split(b"--" + boundary):
+        head, _, value = part.partition(b"\r\n\r\n")
+        head = head.decode("latin-1")
+        if 'name="' not in head or "filename=" in head:
+            continue
+        name = head.split('name="', 1)[1].split('"', 1)[0]
+        fields[name] = value.rstrip(b"\r\n").decode("utf-8", "replace")
+    return fields
+
+
+class FakeBotApi:
+    def __init__(self, host: str = "127.0.0.1", port: int = 0):
+        self.host = host
+        self.port = port
+        self.webhook_url = ""
+        self.webhook_secret = ""
+        self.calls: dict[str, int] = {}
+        self.replies: asyncio.Queue = asyncio.Queue()  # (perf_counter, method, params)
+        self._updates: list[dict] = []
+        self._new_update = asyncio.Event()
+        self._next_update_id = 1
+        self._next_message_id = 1
+        self._server = None
+        self._client = None
+
+    @property
+    def url(self) -> str:
+        return f"http://{self.host}:{self.port}"
+
+    async def start(self):
+        import httpx
+
+        self._server = await asyncio.start_server(self._serve, self.host, self.port)
+        self.port = self._server.sockets[0].getsockname()[1]
+        self._client = httpx.AsyncClient(timeout=10)
+
+    async def close(self):
+        if self._client is not None:
+            await self._client.aclose()
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+
+    # ── обновления ───────────────────────────────────────────────────────────
+    def make_update(self, text: str, user_id: int = 1001, chat_type: str = "private") -> dict:
+        update_id = self._next_update_id
+        self._next_update_id += 1
+        message = {
+            "message_id": update_id,
+            "date": int(time.time()),
+            "chat": {"id": user_id, "type": chat_type},
+            "from": {"id": user_id, "is_bot": False, "first_name": "Bench"},
+            "text": text,
+        }
+        if text.startswith("/"):
+            message["entities"] = [{"type": "bot_command", "offset": 0, "length": len(text.split()[0])}]
+        return {"update_id": update_id, "message": message}
+
+    def push_update(self, update: dict):
+        self._updates.append(update)
+        self._new_update.set()
+
+    async def deliver_update(self, update: dict):
+        headers = {"X-Telegram-Bot-Api-Secret-Token": self.webhook_secret} if self.webhook_secret else {}
+        resp = await self._client.post(self.webhook_url, json=update, headers=headers)
+        resp.raise_for_status()
+
+    async def _get_updates(self, params: dict) -> list[dict]:
+        offset = int(params.get("offset") or 0)
+        self._updates = [u for u in self._updates if u["update_id"] >= offset]
+        if not self._updates:
+            self._new_update.clear()
+            try:
+                await asyncio.wait_for(self._new_update.wait(), float(params.get("timeout") or 0))
+            except asyncio.TimeoutError:
+                pass
+        return [u for u in self._updates if u["update_id"] >= offset]
+
+    # ── методы Bot API ───────────────────────────────────────────────────────
+    async def _call(self, method: str, params: dict):
+        self.calls[method] = self.calls.get(method, 0) + 1
+        if method == "getme":
+            return BOT_USER
+        if method == "getupdates":
+            return await self._get_updates(params)
+        if method == "setwebhook":
+            self.webhook_url = params.get("url", "")
+            self.webhook_secret = params.get("secret_token", "")
+            return True
+        if method == "deletewebhook":
+            self.webhook_url = ""
+            return True
+        if method.startswith("send"):
+            self.replies.put_nowait((time.perf_counter(), method, params))
+            message_id = self._next_message_id
+            self._next_message_id += 1
+            chat_id = int(params.get("chat_id", 0))
+            return {
+                "message_id": message_id,
+                "date": int(time.time()),
+                "chat": {"id": chat_id, "type": "private"},
+                "text": params.get("text", ""),
+            }
+        return True
+
+    # ── HTTP/1.1 с keep-alive ────────────────────────────────────────────────
+    async def _serve(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            while True:
+                head = await reader.readuntil(b"\r\n\r\n")
+                lines = head.decode("latin-1").split("\r\n")
+                _verb, path, _ver = lines[0].split(" ", 2)
+                headers = {}
+                for line in lines[1:]:
+                    if ":" in line:
+                        k, v = line.split(":", 1)
+                        headers[k.strip().lower()] = v.strip()
+                body = await reader.readexactly(int(headers.get("content-length", 0)))
+
+                ctype = headers.get("content-type", "")
+                if ctype.startswith("application/json"):
+                    params = json.loads(body or b"{}")
+                elif ctype.startswith("multipart/form-data"):
+                    params = _multipart_fields(body, ctype)
+                else:
+                    params = dict(parse_qsl(body.decode("utf-8")))
+
+                method = path.rsplit("/", 1)[-1].lower()
+                payload = json.dumps({"ok": True, "result": await self._call(method, params)}).encode()
+                writer.write(
+                    b"HTTP/1.1 200 OK\r\nContent-Type: application/json\r\n"
+                    b"Content-Length: " + str(len(payload)).encode() + b"\r\n\r\n" + payload
+                )
+                await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError, asyncio.CancelledError):
+            pass  # клиент закрыл соединение или сервер останавливается посреди long polling
+        finally:
+            writer.close()
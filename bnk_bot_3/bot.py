@@ -0,0 +1,13 @@
+"""
+Точка входа аддона (run.sh): python3 -u /app/bot.py
+
+Процессы графиков запускаются через spawn и перед работой заново выполняют
+главный скрипт (как __mp_main__). Поэтому главный скрипт — этот, а бот
+импортируется только под __main__: иначе каждый воркер поднимал бы telegram,
+хранилище и все глобальные объекты main.py.
+"""
+
+if __name__ == "__main__":
+    import main
+
+    main.main()
@@ -0,0 +1,120 @@
+"""
+Точка входа процессов графиков: рендер /graf и инициализатор воркера.
+Модуль нарочно не импортирует ничего из бота — процесс пула (spawn) загружает
+только его и matplotlib, без telegram, хранилища и глобальных объектов main.py.
+"""
+import io
+from datetime import date
+
+
+# ────────────────────────────────────────────────
+# Рендер графиков /graf (выполняется в процессе-воркере)
+# ────────────────────────────────────────────────
+def init_worker():
+    """Инициализатор воркера: тяжёлый импорт matplotlib делаем один раз на процесс."""
+    import matplotlib
+    matplotlib.use("Agg")
+    import matplotlib.pyplot  # noqa: F401
+
+
+def warmup() -> bool:
+    return True
+
+
+def _png(fig) -> bytes:
+    import matplotlib.pyplot as plt
+
+    buf = io.BytesIO()
+    fig.savefig(buf, format="png")
+    plt.close(fig)
+    return buf.getvalue()
+
+
+def render_graf(daily: list[tuple[str, float, float]], users: dict) -> list[bytes]:
+    """
+    Строит 4 графика /graf по итогам месяца (или диапазона месяцев) и возвращает их PNG-байтами.
+      daily — [(YYYY-MM-DD, Вес, Итого), ...] по дням;
+      users — итоги по пользователям в формате user_stats.
+    Пустой список — данных нет.
+    """
+    import matplotlib.pyplot as plt
+
+    if not daily or not users:
+        return []
+
+    images = []
+
+    # ГРАФИК 1 — линия по дням
+    days = [date.fromisoformat(d) for d, _ves, _itogo in daily]
+    day_ves = [ves for _d, ves, _itogo in daily]
+    day_itogo = [itogo for _d, _ves, itogo in daily]
+
+    fig, ax = plt.subplots()
+    ax.plot(days, day_ves, marker="o", label="Вес (кг)")
+    ax.plot(days, day_itogo, marker="o", label="Отходы (кг)")
+
+    ax.set_title("Производство и отходы по дням")
+    ax.set_xlabel("Дата")
+    ax.set_ylabel("Кг")
+    ax.legend()
+    ax.grid(True, alpha=0.25)
+    fig.autofmt_xdate()
+
+    # подписи точек — только в пределах месяца, на диапазоне они сливаются
+    if len(days) <= 31:
+        ymin, ymax = ax.get_ylim()
+        dy = max(1, (ymax - ymin) * 0.02)
+        for x, y in zip(days, day_ves):
+            ax.text(x, y + dy, f"{y:.0f}", ha="center", va="bottom", fontsize=8)
+        for x, y in zip(days, day_itogo):
+            ax.text(x, y + dy, f"{y:.0f}", ha="center", va="bottom", fontsize=8)
+
+    fig.tight_layout()
+    images.append(_png(fig))
+
+    # ГРАФИК 2 — топ по весу
+    top_users = sorted(users, key=lambda u: users[u]["Вес"], reverse=True)[:10]
+    top_ves = [users[u]["Вес"] for u in top_users]
+    fig = plt.figure()
+    plt.bar(top_users, top_ves)
+    plt.title("ТОП производители по весу (кг)")
+    plt.xlabel("Пользователь")
+    plt.ylabel("Кг")
+    plt.xticks(rotation=45, ha="right")
+    for i, v in enumerate(top_ves):
+        plt.text(i, v, f"{v:.0f}", ha="center", va="bottom")
+
+    plt.tight_layout()
+    images.append(_png(fig))
+
+    # ГРАФИК 3 — доля отходов
+    total_weight = float(sum(u["Вес"] for u in users.values()))
+    total_waste = float(sum(u["Итого"] for u in users.values()))
+    good = max(total_weight - total_waste, 0)
+
+    fig = plt.figure()
+    plt.pie([good, total_waste],
+            labels=["Продукция", "Отходы"],
+            autopct="%1.1f%%",
+            startangle=90)
+    plt.axis("equal")
+    plt.title("Доля отходов в общей массе")
+    images.append(_png(fig))
+
+    # ГРАФИК 4 — топ по браку
+    top_kg = sorted(users, key=lambda u: users[u]["Итого"], reverse=True)[:10]
+    top_kg_vals = [users[u]["Итого"] for u in top_kg]
+
+    fig = plt.figure()
+    plt.bar(top_kg, top_kg_vals)
+    plt.title("Топ по браку (кг)")
+    plt.xlabel("Пользователь")
+    plt.ylabel("Брак, кг")
+    plt.xticks(rotation=45, ha="right")
+    for i, v in enumerate(top_kg_vals):
+        plt.text(i, v, f"{v:.0f}", ha="center", va="bottom")
+
+    plt.tight_layout()
+    images.append(_png(fig))
+
+    return images
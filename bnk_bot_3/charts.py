@@ -0,0 +1,104 @@
+import asyncio
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from chart_worker import init_worker, warmup, render_graf
+
+
+# ────────────────────────────────────────────────
+# Пул процессов для графиков
+# ────────────────────────────────────────────────
+class ChartBusyError(Exception):
+    """Все слоты рендера заняты — новый /graf не ставим в очередь."""
+
+
+class ChartPool:
+    """
+    Прогретый пул процессов для рендера графиков.
+    • workers      — сколько процессов держим (каждый один раз импортирует matplotlib);
+    • max_waiting  — сколько запросов может ждать свободного воркера, остальные получают ChartBusyError;
+    • timeout      — предел на один рендер; зависший воркер перезапускается, как и пул
+                     с умершим воркером (BrokenProcessPool) — /graf не ждёт рестарта аддона.
+    """
+
+    def __init__(self, workers: int = 1, max_waiting: int = 1, timeout: float = 60.0):
+        self.workers = workers
+        self.max_waiting = max_waiting
+        self.timeout = timeout
+        self._executor: ProcessPoolExecutor | None = None
+        self._sem: asyncio.Semaphore | None = None
+        self._waiting = 0
+
+    def start(self):
+        self._sem = asyncio.Semaphore(self.workers)
+        self._spawn()
+
+    def _spawn(self):
+        self._executor = ProcessPoolExecutor(
+            max_workers=self.workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=init_worker,
+        )
+        # прогрев: поднимаем процессы и импорты заранее, а не на первом /graf
+        for _ in range(self.workers):
+            self._executor.submit(warmup)
+
+    def _restart(self):
+        executor, self._executor = self._executor, None
+        for proc in list((getattr(executor, "_processes", None) or {}).values()):
+            proc.terminate()
+        executor.shutdown(wait=False, cancel_futures=True)
+        self._spawn()
+
+    async def render(self, daily: list, users: dict) -> list[bytes]:
+        if self._waiting >= self.workers + self.max_waiting:
+            raise ChartBusyError()
+
+        self._waiting += 1
+        try:
+            async with self._sem:
+                try:
+                    fut = self._executor.submit(render_graf, daily, users)
+                except BrokenProcessPool:
+                    # воркер умер в простое (OOM killer) — запрос тут ни при чём, пробуем на новом пуле
+                    self._restart()
+                    fut = self._executor.submit(render_graf, daily, users)
+                try:
+                    return await asyncio.wait_for(asyncio.wrap_future(fut), self.timeout)
+                except (asyncio.TimeoutError, BrokenProcessPool):
+                    self._restart()
+                    raise
+        finally:
+            self._waiting -= 1
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+
+# ────────────────────────────────────────────────
+# Кэш готовых графиков (Telegram file_id)
+# ────────────────────────────────────────────────
+class GrafCache:
+    """
+    Кэш /graf: месяц или диапазон 'FROM..TO' → (версии месяцев, file_id отправленных картинок).
+    Пока версии месяцев не изменились, графики не перерисовываются и не
+    загружаются заново — Telegram повторно отдаёт уже загруженные фото по file_id.
+    """
+
+    def __init__(self):
+        self._entries: dict[str, tuple[tuple, list[str]]] = {}
+
+    def get(self, ym: str, version: tuple) -> list[str] | None:
+        entry = self._entries.get(ym)
+        if entry is None or entry[0] != version:
+            return None
+        return entry[1]
+
+    def put(self, ym: str, version: tuple, file_ids: list[str]):
+        self._entries[ym] = (version, list(file_ids))
+
+    def invalidate(self, ym: str):
+        self._entries.pop(ym, None)
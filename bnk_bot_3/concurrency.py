@@ -0,0 +1,107 @@
+import asyncio
+from contextlib import asynccontextmanager
+
+from telegram.ext import BaseUpdateProcessor
+
+
+# ────────────────────────────────────────────────
+# Параллельная обработка апдейтов с порядком внутри чата
+# ────────────────────────────────────────────────
+class ChatOrderedProcessor(BaseUpdateProcessor):
+    """
+    Апдейты разных чатов обрабатываются параллельно, одного чата — строго по
+    очереди поступления (значит, и правки одного message_id идут после самого
+    сообщения). Два предела:
+    • max_running — хэндлеров, выполняющихся одновременно; слот занимается,
+      только когда подошла очередь чата, поэтому медленный /graf в одном цехе
+      не держит слоты, нужные остальным;
+    • max_waiting — апдейтов в работе и в очереди всего (семафор PTB).
+    Апдейты без чата (их у бота нет, но вдруг) идут без упорядочивания.
+    """
+
+    def __init__(self, max_running: int = 16, max_waiting: int = 256):
+        super().__init__(max(max_waiting, max_running, 2))  # 1 — PTB обработает апдейты последовательно
+        self.max_running = max_running
+        self._running = asyncio.BoundedSemaphore(max_running)
+        self._chats: dict[int, list] = {}  # chat_id → [asyncio.Lock, апдейтов в работе и в очереди]
+
+    @staticmethod
+    def _chat_of(update) -> int | None:
+        chat = getattr(update, "effective_chat", None)
+        return chat.id if chat is not None else None
+
+    async def do_process_update(self, update, coroutine):
+        chat_id = self._chat_of(update)
+        if chat_id is None:
+            async with self._running:
+                await coroutine
+            return
+
+        # asyncio.Lock пускает ожидающих по порядку, а задачи апдейтов PTB создаёт в порядке поступления
+        entry = self._chats.setdefault(chat_id, [asyncio.Lock(), 0])
+        entry[1] += 1
+        try:
+            async with entry[0]:
+                async with self._running:
+                    await coroutine
+        finally:
+            entry[1] -= 1
+            if not entry[1]:
+                del self._chats[chat_id]
+
+    async def initialize(self):
+        pass
+
+    async def shutdown(self):
+        pass
+
+    @property
+    def active_chats(self) -> int:
+        """Чаты, у которых есть апдейты в работе или в очереди."""
+        return len(self._chats)
+
+
+# ────────────────────────────────────────────────
+# Совместная / исключительная блокировка
+# ────────────────────────────────────────────────
+class SharedLock:
+    """
+    Много совместных владельцев (запись отчёта + обновление итогов) или один
+    исключительный (/import: удаление месяца, импорт, перечитывание итогов).
+    Ждущий исключительный доступ не пропускает новых совместных — импорт не
+    голодает, пока идут отчёты.
+    """
+
+    def __init__(self):
+        self._cond = asyncio.Condition()
+        self._shared = 0
+        self._exclusive = False
+        self._waiting = 0  # ждут исключительного доступа
+
+    @asynccontextmanager
+    async def shared(self):
+        async with self._cond:
+            await self._cond.wait_for(lambda: not self._exclusive and not self._waiting)
+            self._shared += 1
+        try:
+            yield
+        finally:
+            async with self._cond:
+                self._shared -= 1
+                self._cond.notify_all()
+
+    @asynccontextmanager
+    async def exclusive(self):
+        async with self._cond:
+            self._waiting += 1
+            try:
+                await self._cond.wait_for(lambda: not self._exclusive and not self._shared)
+            finally:
+                self._waiting -= 1
+            self._exclusive = True
+        try:
+            yield
+        finally:
+            async with self._cond:
+                self._exclusive = False
+                self._cond.notify_all()
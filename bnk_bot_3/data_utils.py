@@ -1,7 +1,14 @@
+import io
 import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 
-from openpyxl import Workbook, load_workbook
+import rollup
+from metrics import SAVE_ROWS, SAVE_SECONDS
+
+# openpyxl импортируется лениво, внутри функций: на старте бота он не нужен,
+# а его импорт заметно тормозит холодный старт на слабом хосте.
 
 # ──────────────────────────────────────────────────────────────────────────────
 # Папки для данных и графиков
@@ -22,7 +29,7 @@ def get_file_path(dt=None) -> str:
     """
     if dt is None:
         dt = datetime.now()
-    return os.path.join(DATA_DIR, f"{dt.strftime('%Y-%m')}.xlsx")
+    return get_month_file_str(dt.strftime('%Y-%m'))
 
 
 def get_csv_file() -> str:
@@ -34,49 +41,270 @@ def get_csv_file() -> str:
 
 def get_month_file_str(ym: str) -> str:
     """
-    Вспомогательно: путь к файлу месяца по строке 'YYYY-MM' (без проверки существования).
+    Вспомогательно: путь к Excel месяца по строке 'YYYY-MM' (без проверки существования).
+    Для SQLite — путь последней выгрузки export_month().
+    """
+    return get_storage().month_file(ym)
+
+
+# ──────────────────────────────────────────────────────────────────────────────
+# Хранилище отчётов: Excel (по умолчанию) или SQLite
+# ──────────────────────────────────────────────────────────────────────────────
+# Выбирается опцией STORAGE_BACKEND аддона (excel | sqlite):
+#   excel  — журнал + свёртка + Excel месяца в DATA_DIR (см. excel_store.py);
+#   sqlite — база DATA_DIR/reports.db, Excel собирается по запросу (см. sqlite_store.py).
+# Остальной код работает только через функции ниже и от выбора не зависит.
+#
+# Разделы (partition): у каждого цеха-чата свой набор данных в DATA_DIR/chats/<раздел>
+# со своим экземпляром хранилища — свои файлы, блокировки и версии месяцев, так что
+# запись одного цеха не ждёт другой. Раздел None — сам DATA_DIR (один чат, как раньше).
+# Какой чат в какой раздел пишет, решает main.py.
+STORAGE_BACKEND = os.getenv("STORAGE_BACKEND", "excel").strip().lower() or "excel"
+PARTITIONS_DIR = "chats"
+
+_storages: dict[str | None, object] = {}
+_storage_guard = threading.Lock()
+
+
+def partition_dir(partition: str | None = None) -> str:
+    """Каталог данных раздела: DATA_DIR для None, иначе DATA_DIR/chats/<раздел>."""
+    if partition is None:
+        return DATA_DIR
+    return os.path.join(DATA_DIR, PARTITIONS_DIR, partition)
+
+
+def partitions() -> list[str | None]:
+    """Разделы, у которых есть данные на диске (основной — всегда, первым)."""
+    root = os.path.join(DATA_DIR, PARTITIONS_DIR)
+    names = sorted(os.listdir(root)) if os.path.isdir(root) else []
+    return [None] + [n for n in names if os.path.isdir(os.path.join(root, n))]
+
+
+def get_storage(partition: str | None = None):
+    """Хранилище отчётов раздела; создаётся при первом обращении (после выбора DATA_DIR)."""
+    with _storage_guard:
+        storage = _storages.get(partition)
+        if storage is None:
+            root = partition_dir(partition)
+            if STORAGE_BACKEND == "sqlite":
+                from sqlite_store import SqliteStorage
+
+                storage = SqliteStorage(root)
+            else:
+                if STORAGE_BACKEND != "excel":
+                    print(f"[WARN] неизвестный STORAGE_BACKEND={STORAGE_BACKEND!r}, используется excel")
+                from excel_store import ExcelStorage
+
+                storage = ExcelStorage(root)
+            _storages[partition] = storage
+        return storage
+
+
+def set_data_dir(path: str):
+    """Другой каталог данных (backfill --data-dir); вызывать до первой записи."""
+    global DATA_DIR
+    DATA_DIR = path
+    os.makedirs(DATA_DIR, exist_ok=True)
+    _storages.clear()
+
+
+def get_month_version(ym: str, partition: str | None = None) -> int:
+    """
+    Версия данных месяца: растёт при каждой записи/удалении.
+    Кэши производных данных (графики /graf) сверяются с ней.
     """
-    return os.path.join(DATA_DIR, f"{ym}.xlsx")
+    return get_storage(partition).month_version(ym)
+
+
+def export_month(ym: str, partition: str | None = None) -> str:
+    """
+    Путь к актуальному Excel месяца для отправки (/csv, /import YYYY-MM).
+    Если данных за месяц нет — файл так и не появится, путь всё равно вернётся.
+    """
+    return get_storage(partition).export_month(ym)
+
+
+def settle_month(ym: str, partition: str | None = None):
+    """Довести месяц до Excel после смены месяца или массовой записи (для SQLite — ничего)."""
+    get_storage(partition).settle(ym)
+
+
+def maintain_storage():
+    """Фоновое обслуживание всех разделов (старт бота, таймер): уплотнение журналов / checkpoint WAL."""
+    for partition in partitions():
+        get_storage(partition).maintain()
+
+
+def delete_month(ym: str, partition: str | None = None):
+    """Удаляет данные месяца (используется при импорте поверх текущего месяца)."""
+    get_storage(partition).delete_month(ym)
+
+
+def month_files(ym: str, partition: str | None = None) -> dict[str, str]:
+    """{вид файла: путь} — файлы месяца в хранилище (для метрик размера)."""
+    return get_storage(partition).month_files(ym)
+
+
+def month_user_totals(ym: str, partition: str | None = None) -> dict:
+    """Итоги месяца по пользователям (формат user_stats)."""
+    return get_storage(partition).user_totals(ym)
+
+
+def month_key_totals(ym: str, partition: str | None = None) -> tuple[dict, dict]:
+    """Итоги месяца по ключам пользователей (Telegram ID) и их имена: ({ключ: итоги}, {ключ: имя})."""
+    return get_storage(partition).key_totals(ym)
+
+
+def month_daily_totals(ym: str, partition: str | None = None) -> list[tuple[str, float, float]]:
+    """Вес и отходы месяца по дням: [(YYYY-MM-DD, Вес, Итого), ...]."""
+    return get_storage(partition).daily_totals(ym)
 
 
 # ──────────────────────────────────────────────────────────────────────────────
 # Запись данных
 # ──────────────────────────────────────────────────────────────────────────────
-def save_entry(date: datetime, user: str, values: dict):
+def save_entry(date: datetime, user: str, values: dict, user_id: int | None = None):
+    """
+    Сохраняем одну запись в МЕСЯЦ, соответствующий дате записи.
+    Колонки: Дата | Имя | Паков | Вес | Пакетосварка | Флекса | Экструзия | Итого | ID
+    """
+    save_entries([(date, user, values, user_id)])
+
+
+def save_entries(entries: list[tuple], partition: str | None = None):
+    """
+    Пакетная запись в раздел: [(date, user, values[, user_id]), ...].
+    Записи группируются по месяцам: одна дозапись журнала (Excel) или одна транзакция (SQLite).
+    """
+    with SAVE_SECONDS.time():
+        get_storage(partition).append(entries)
+    SAVE_ROWS.inc(amount=len(entries))
+
+
+# ──────────────────────────────────────────────────────────────────────────────
+# Диапазоны месяцев (/stats FROM..TO, /graf FROM..TO)
+# ──────────────────────────────────────────────────────────────────────────────
+MAX_RANGE_MONTHS = 36
+RANGE_WORKERS = 4
+
+# Закрытые месяцы не пополняются отчётами: их итоги держим в памяти и сверяем
+# только с версией месяца (её меняют лишь /import и удаление). Ключ — (раздел, месяц).
+_closed_months: dict[tuple[str | None, str], tuple[int, tuple[dict, dict], list]] = {}
+
+
+def parse_month_range(text: str) -> list[str]:
+    """
+    'YYYY-MM..YYYY-MM', 'YYYY-MM YYYY-MM' или один 'YYYY-MM' → список месяцев по порядку.
+    ValueError — неверный формат, конец раньше начала или диапазон длиннее MAX_RANGE_MONTHS.
+    """
+    parts = text.replace("..", " ").split()
+    if not 1 <= len(parts) <= 2:
+        raise ValueError(text)
+    start = datetime.strptime(parts[0], "%Y-%m")
+    end = datetime.strptime(parts[-1], "%Y-%m")
+    count = (end.year - start.year) * 12 + end.month - start.month + 1
+    if count < 1 or count > MAX_RANGE_MONTHS:
+        raise ValueError(text)
+
+    months = []
+    y, m = start.year, start.month
+    for _ in range(count):
+        months.append(f"{y}-{m:02d}")
+        y, m = (y + 1, 1) if m == 12 else (y, m + 1)
+    return months
+
+
+def _load_month_totals(ym: str, closed: bool, partition: str | None) -> tuple[tuple[dict, dict], list]:
+    version = get_month_version(ym, partition)
+    if closed:
+        cached = _closed_months.get((partition, ym))
+        if cached is not None and cached[0] == version:
+            return cached[1], cached[2]
+    users, daily = month_key_totals(ym, partition), month_daily_totals(ym, partition)
+    if closed:
+        _closed_months[(partition, ym)] = (version, users, daily)
+    return users, daily
+
+
+def range_totals(months: list[str], partition: str | None = None) -> tuple[dict, list[tuple[str, float, float]]]:
+    """
+    Итоги по диапазону месяцев: (user_stats за весь диапазон, [(день, Вес, Итого), ...]).
+    Месяцы загружаются параллельно (у каждого своя блокировка), закрытые — из кэша.
+    Пользователи сводятся по Telegram ID, имя — из самого позднего месяца.
+    """
+    current = datetime.now().strftime('%Y-%m')
+    with ThreadPoolExecutor(max_workers=max(1, min(RANGE_WORKERS, len(months)))) as pool:
+        parts = list(pool.map(lambda ym: _load_month_totals(ym, ym < current, partition), months))
+
+    users: dict[str, dict] = {}
+    names: dict[str, str] = {}
+    daily: list[tuple[str, float, float]] = []
+    for (month_users, month_names), month_daily in parts:
+        for key, data in month_users.items():
+            acc = users.setdefault(key, dict.fromkeys(rollup.METRICS, 0.0) | {"Смен": 0})
+            for k in acc:
+                acc[k] += data.get(k, 0)
+        names.update(month_names)
+        daily.extend(month_daily)  # месяцы идут по порядку, дни внутри месяца — тоже
+    return rollup.display_totals(users, names), daily
+
+
+# ──────────────────────────────────────────────────────────────────────────────
+# Массовый импорт Excel (/import)
+# ──────────────────────────────────────────────────────────────────────────────
+def _import_date(value) -> datetime:
+    if isinstance(value, datetime):
+        return value
+    if isinstance(value, str):
+        try:
+            return datetime.strptime(value, "%Y-%m-%d %H:%M")
+        except ValueError:
+            pass
+    return datetime.now()
+
+
+def import_workbook(data: bytes, progress: dict | None = None, partition: str | None = None) -> dict[str, int]:
     """
-    Сохраняем одну строку в Excel МЕСЯЦА, соответствующего дате записи.
-    Колонки: Дата | Имя | Паков | Вес | Пакетосварка | Флекса | Экструзия | Итого
+    Импорт книги формата бота (Дата | Имя | Паков | … | Итого[ | ID]) из байтов загрузки.
+    Книга читается потоково (read_only), строки группируются по месяцам,
+    и каждый затронутый месяц пишется одним пакетом (для Excel — одна дозапись
+    журнала и одно сохранение книги). Итоги месяцев обновляются тем же проходом.
+    progress["rows"] — счётчик прочитанных строк для сообщений о ходе импорта.
+    Возвращает {YYYY-MM: число записей}.
     """
-    file_path = get_file_path(date)  # ключевая строка: ротация по месяцу записи
+    from openpyxl import load_workbook
 
-    if os.path.exists(file_path):
-        wb = load_workbook(file_path)
-        ws = wb.active
-    else:
-        wb = Workbook()
-        ws = wb.active
-        ws.append(["Дата", "Имя", "Паков", "Вес", "Пакетосварка", "Флекса", "Экструзия", "Итого"])
+    by_month: dict[str, list[tuple]] = {}
+    wb = load_workbook(io.BytesIO(data), read_only=True, data_only=True)
+    try:
+        for n, row in enumerate(wb.active.iter_rows(min_row=2, values_only=True), 1):
+            if progress is not None:
+                progress["rows"] = n
+            row = (tuple(row) + (None,) * 9)[:9]
+            date_cell, user = row[0], row[1]
+            if not user:
+                continue
 
-    ws.append([
-        date.strftime('%Y-%m-%d %H:%M'),
-        user,
-        float(values.get("Паков", 0) or 0),
-        float(values.get("Вес", 0) or 0),
-        float(values.get("Пакетосварка", 0) or 0),
-        float(values.get("Флекса", 0) or 0),
-        float(values.get("Экструзия", 0) or 0),
-        float(values.get("Итого", 0) or 0),
-    ])
+            date_obj = _import_date(date_cell)
+            values = {k: v or 0 for k, v in zip(rollup.METRICS, row[2:8])}
+            by_month.setdefault(date_obj.strftime('%Y-%m'), []).append(
+                (date_obj, user, values, rollup.row_user_id(row))
+            )
+    finally:
+        wb.close()
 
-    wb.save(file_path)
+    for ym, entries in by_month.items():
+        save_entries(entries, partition)
+        settle_month(ym, partition)
+    return {ym: len(entries) for ym, entries in by_month.items()}
 
 
 # ──────────────────────────────────────────────────────────────────────────────
 # Текстовая статистика /stats
 # ──────────────────────────────────────────────────────────────────────────────
-def generate_stats(stats: dict) -> str:
+def generate_stats(stats: dict, period: str | None = None) -> str:
     """
-    Текстовая сводка /stats по пользователям.
+    Текстовая сводка /stats по пользователям (period — подпись диапазона, если не текущий месяц).
     Ожидается структура:
       user_stats[user] = {
           'Паков': float, 'Вес': float, 'Пакетосварка': float, 'Флекса': float,
@@ -86,7 +314,7 @@ def generate_stats(stats: dict) -> str:
     if not stats:
         return "📊 Статистика пуста."
 
-    lines = ["📊 Статистика по пользователям:"]
+    lines = [f"📊 Статистика по пользователям за {period}:" if period else "📊 Статистика по пользователям:"]
     for user, data in stats.items():
         lines.append(
             f"{user}:\n"
@@ -0,0 +1,80 @@
+import hashlib
+import json
+import os
+import threading
+
+
+# ────────────────────────────────────────────────
+# Кэш отправленных Excel-файлов (Telegram file_id)
+# ────────────────────────────────────────────────
+class DocumentCache:
+    """
+    Месяц → {"sha256", "size", "mtime_ns", "file_id"} последнего отправленного Excel.
+    Если файл месяца не изменился (тот же хэш содержимого), /csv и /import YYYY-MM
+    отправляют его по file_id — без повторной загрузки байтов в Telegram.
+    Размер и mtime позволяют не считать хэш, пока файл не трогали.
+    Хранится в JSON рядом с данными, поэтому переживает перезапуск аддона.
+    lookup() вызывается из потоков (чаты обслуживаются параллельно), поэтому
+    записи и файл меняются под блокировкой; хэш считается вне её.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._entries: dict[str, dict] = {}
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                self._entries = json.load(f)
+        except (OSError, ValueError):
+            self._entries = {}
+
+    @staticmethod
+    def _sha256(file_path: str) -> str:
+        h = hashlib.sha256()
+        with open(file_path, "rb") as f:
+            for chunk in iter(lambda: f.read(1 << 16), b""):
+                h.update(chunk)
+        return h.hexdigest()
+
+    def lookup(self, ym: str, file_path: str) -> tuple[str | None, dict]:
+        """
+        (file_id или None, отпечаток файла). Отпечаток передаётся в remember()
+        после загрузки — так в кэш попадает именно тот файл, что был отправлен.
+        """
+        st = os.stat(file_path)
+        stamp = {"size": st.st_size, "mtime_ns": st.st_mtime_ns}
+        with self._lock:
+            entry = self._entries.get(ym)
+        if entry and entry["size"] == stamp["size"] and entry["mtime_ns"] == stamp["mtime_ns"]:
+            return entry["file_id"], dict(entry, **stamp)
+
+        stamp["sha256"] = self._sha256(file_path)
+        if entry and entry["sha256"] == stamp["sha256"]:
+            # содержимое то же (например, файл пересохранён) — освежаем отпечаток
+            fresh = dict(entry, **stamp)
+            with self._lock:
+                if self._entries.get(ym) is entry:  # не сброшен, пока считали хэш
+                    self._entries[ym] = fresh
+                    self._save()
+            return entry["file_id"], fresh
+        return None, stamp
+
+    def remember(self, ym: str, stamp: dict, file_id: str):
+        if "sha256" not in stamp:
+            return
+        with self._lock:
+            self._entries[ym] = dict(stamp, file_id=file_id)
+            self._save()
+
+    def invalidate(self, ym: str):
+        """Запись в месяц (отчёт, импорт, удаление) — прежний file_id больше не годится."""
+        with self._lock:
+            if self._entries.pop(ym, None) is not None:
+                self._save()
+
+    def _save(self):
+        """Вызывать под self._lock."""
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self._entries, f, ensure_ascii=False)
+        os.replace(tmp_path, self.path)
@@ -0,0 +1,423 @@
+import fcntl
+import json
+import os
+import threading
+from contextlib import contextmanager
+from datetime import datetime
+
+import rollup
+from metrics import COMPACT_SECONDS
+
+# openpyxl импортируется лениво, внутри методов: при старте бота по сверенной
+# свёртке он не нужен, а его импорт заметно тормозит холодный старт на слабом хосте.
+
+# Колонки Excel-файла месяца (и выгрузки /csv при любом хранилище)
+# (в файлах до появления колонки ID — первые 8; читатели принимают оба вида строк)
+HEADER = ["Дата", "Имя", "Паков", "Вес", "Пакетосварка", "Флекса", "Экструзия", "Итого", "ID"]
+
+
+def make_row(date: datetime, user: str, values: dict, user_id: int | None = None) -> list:
+    """Строка отчёта в формате Excel: Дата | Имя | Паков | Вес | Пакетосварка | Флекса | Экструзия | Итого | ID"""
+    return [
+        date.strftime('%Y-%m-%d %H:%M'),
+        user,
+        float(values.get("Паков", 0) or 0),
+        float(values.get("Вес", 0) or 0),
+        float(values.get("Пакетосварка", 0) or 0),
+        float(values.get("Флекса", 0) or 0),
+        float(values.get("Экструзия", 0) or 0),
+        float(values.get("Итого", 0) or 0),
+        user_id,
+    ]
+
+
+# ──────────────────────────────────────────────────────────────────────────────
+# Хранилище «Excel»: журнал отчётов (append-only) + свёртка + уплотнение в Excel
+# ──────────────────────────────────────────────────────────────────────────────
+# Каждый отчёт дописывается одной строкой JSON в YYYY-MM.journal (с fsync),
+# а Excel месяца пересобирается лениво — в compact_month(): по /csv, /import,
+# при смене месяца и по таймеру. Номер последней перенесённой записи хранится
+# в свойствах книги (identifier), поэтому повторное уплотнение после сбоя
+# не задваивает строки.
+# Месяц могут писать два процесса сразу — бот и backfill.py в том же контейнере,
+# поэтому запись, уплотнение и чтение идут под flock на YYYY-MM.lock, а номер
+# записи и свёртка в памяти сверяются с файлами после взятия блокировки.
+_JOURNAL_SEQ_PREFIX = "journal-seq:"
+
+
+def _read_journal(path: str) -> list[tuple[int, list]]:
+    """Читает записи журнала; оборванную (недописанную при сбое) строку пропускаем."""
+    if not os.path.exists(path):
+        return []
+    records = []
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                rec = json.loads(line)
+                records.append((int(rec["seq"]), rec["row"]))
+            except (ValueError, KeyError, TypeError):
+                continue
+    return records
+
+
+def _workbook_seq(wb) -> int:
+    ident = wb.properties.identifier or ""
+    if ident.startswith(_JOURNAL_SEQ_PREFIX):
+        try:
+            return int(ident[len(_JOURNAL_SEQ_PREFIX):])
+        except ValueError:
+            pass
+    return 0
+
+
+class ExcelStorage:
+    """
+    Файлы месяца в каталоге root:
+      YYYY-MM.xlsx          — Excel (система учёта и выгрузка /csv);
+      YYYY-MM.journal       — ещё не перенесённые в Excel отчёты;
+      YYYY-MM.rollup.json   — свёртка день × пользователь (см. rollup.py);
+      YYYY-MM.lock          — блокировка месяца между процессами (пустой).
+    """
+
+    name = "excel"
+
+    def __init__(self, root: str):
+        self.root = root
+        os.makedirs(root, exist_ok=True)
+        self._locks_guard = threading.Lock()
+        self._month_locks: dict[str, threading.Lock] = {}
+        self._next_seq: dict[str, int] = {}
+        self._month_versions: dict[str, int] = {}
+        self._rollups: dict[str, dict] = {}
+        self._foreign: dict[str, list] = {}  # ym → отпечаток чужих изменений, уже учтённый в версии
+
+    # ── пути ─────────────────────────────────────────────────────────────────
+    def month_file(self, ym: str) -> str:
+        """Путь к Excel месяца: <root>/YYYY-MM.xlsx (без проверки существования)."""
+        return os.path.join(self.root, f"{ym}.xlsx")
+
+    def journal_path(self, ym: str) -> str:
+        return os.path.join(self.root, f"{ym}.journal")
+
+    def _compacting_path(self, ym: str) -> str:
+        return self.journal_path(ym) + ".compacting"
+
+    def rollup_path(self, ym: str) -> str:
+        return os.path.join(self.root, f"{ym}.rollup.json")
+
+    def lock_path(self, ym: str) -> str:
+        return os.path.join(self.root, f"{ym}.lock")
+
+    def month_files(self, ym: str) -> dict[str, str]:
+        """Файлы месяца, чей размер стоит отслеживать (метрики)."""
+        return {"xlsx": self.month_file(ym), "journal": self.journal_path(ym)}
+
+    def _month_lock(self, ym: str) -> threading.Lock:
+        with self._locks_guard:
+            lock = self._month_locks.get(ym)
+            if lock is None:
+                lock = self._month_locks[ym] = threading.Lock()
+            return lock
+
+    @contextmanager
+    def _locked(self, ym: str):
+        """
+        Месяц под блокировкой: потоки процесса ждут _month_lock(ym), другие
+        процессы — flock на YYYY-MM.lock. Если файлы месяца с прошлого раза менял
+        другой процесс (отпечаток не совпал со свёрткой в памяти), номер записи и
+        свёртка перечитываются — иначе новые записи получили бы уже занятые номера.
+        """
+        with self._month_lock(ym):
+            with open(self.lock_path(ym), "a") as f:
+                fcntl.flock(f, fcntl.LOCK_EX)  # снимается при закрытии файла
+                cached = self._rollups.get(ym)
+                if cached is None or cached.get("source") != self._source_signature(ym):
+                    self._rollups.pop(ym, None)
+                    self._next_seq.pop(ym, None)
+                    if cached is not None and cached.get("source"):
+                        self._bump_version(ym)  # данные месяца изменились не у нас
+                yield
+
+    # ── версия данных ────────────────────────────────────────────────────────
+    def month_version(self, ym: str) -> int:
+        """
+        Версия данных месяца. Зовётся из event loop (/graf), поэтому без блокировки:
+        если файлы менял другой процесс, версия поднимается по их отпечатку, а кэш
+        сбросит следующая операция под _locked(ym).
+        """
+        cached = self._rollups.get(ym)
+        if cached is not None and cached.get("source"):
+            signature = self._source_signature(ym)
+            if signature != cached["source"] and signature != self._foreign.get(ym):
+                self._foreign[ym] = signature
+                self._bump_version(ym)
+        return self._month_versions.get(ym, 0)
+
+    def _bump_version(self, ym: str):
+        self._month_versions[ym] = self._month_versions.get(ym, 0) + 1
+
+    # ── журнал ───────────────────────────────────────────────────────────────
+    def _last_seq(self, ym: str) -> int:
+        """Последний номер записи месяца: максимум по журналам и по книге."""
+        seq = 0
+        for path in (self._compacting_path(ym), self.journal_path(ym)):
+            for s, _row in _read_journal(path):
+                seq = max(seq, s)
+        file_path = self.month_file(ym)
+        if os.path.exists(file_path):
+            from openpyxl import load_workbook
+
+            wb = load_workbook(file_path, read_only=True)
+            seq = max(seq, _workbook_seq(wb))
+            wb.close()
+        return seq
+
+    def _append_journal(self, ym: str, rows: list[list]):
+        """
+        Дописывает строки в журнал месяца одним fsync и обновляет свёртку.
+        Вызывать под _locked(ym).
+        """
+        month_rollup = self._get_rollup(ym)
+        if ym not in self._next_seq:
+            self._next_seq[ym] = self._last_seq(ym) + 1
+
+        lines = []
+        for row in rows:
+            lines.append(json.dumps({"seq": self._next_seq[ym], "row": row}, ensure_ascii=False))
+            self._next_seq[ym] += 1
+
+        with open(self.journal_path(ym), "a", encoding="utf-8") as f:
+            f.write("\n".join(lines) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+
+        rollup.add_rows(month_rollup, rows)
+        month_rollup["seq"] = self._next_seq[ym] - 1
+        month_rollup["source"] = self._source_signature(ym)
+        rollup.save_rollup(self.rollup_path(ym), month_rollup)
+        self._bump_version(ym)
+
+    def _journal_records_after(self, ym: str, seq: int) -> list[tuple[int, list]]:
+        records = []
+        for path in (self._compacting_path(ym), self.journal_path(ym)):
+            records.extend((s, row) for s, row in _read_journal(path) if s > seq)
+        return records
+
+    def append(self, entries: list[tuple]):
+        """
+        Пакетная запись: [(date, user, values[, user_id]), ...] — каждая в месяц своей даты.
+        На каждый месяц — одна дозапись журнала и один fsync.
+        """
+        by_month: dict[str, list[list]] = {}
+        for entry in entries:
+            by_month.setdefault(entry[0].strftime('%Y-%m'), []).append(make_row(*entry))
+
+        for ym, rows in by_month.items():
+            with self._locked(ym):
+                self._append_journal(ym, rows)
+
+    # ── уплотнение журнала в Excel ───────────────────────────────────────────
+    def compact_month(self, ym: str) -> str:
+        """
+        Переносит журнал месяца в Excel (одна загрузка и одно сохранение книги)
+        и возвращает путь к актуальному файлу YYYY-MM.xlsx.
+        Если данных за месяц нет — файл так и не появится, путь всё равно вернётся.
+        """
+        file_path = self.month_file(ym)
+        journal_path = self.journal_path(ym)
+        compacting_path = self._compacting_path(ym)
+
+        with self._locked(ym):
+            # журнал «замораживаем» переименованием; недоуплотнённый после сбоя подхватываем
+            if not os.path.exists(compacting_path):
+                if not os.path.exists(journal_path) or os.path.getsize(journal_path) == 0:
+                    return file_path
+                month_rollup = self._get_rollup(ym)
+                os.replace(journal_path, compacting_path)
+            else:
+                month_rollup = self._get_rollup(ym)
+
+            with COMPACT_SECONDS.time():
+                from openpyxl import Workbook, load_workbook
+
+                records = _read_journal(compacting_path)
+
+                if os.path.exists(file_path):
+                    wb = load_workbook(file_path)
+                    ws = wb.active
+                    if ws.cell(row=1, column=len(HEADER)).value is None:
+                        ws.cell(row=1, column=len(HEADER), value=HEADER[-1])  # книга до колонки ID
+                else:
+                    wb = Workbook()
+                    ws = wb.active
+                    ws.append(HEADER)
+
+                done = _workbook_seq(wb)
+                last = done
+                for seq, row in records:
+                    if seq <= done:
+                        continue  # уже перенесено до сбоя
+                    ws.append(row)
+                    last = max(last, seq)
+
+                if last != done or not os.path.exists(file_path):
+                    wb.properties.identifier = f"{_JOURNAL_SEQ_PREFIX}{last}"
+                    tmp_path = file_path + ".tmp"
+                    wb.save(tmp_path)
+                    with open(tmp_path, "rb") as f:
+                        os.fsync(f.fileno())
+                    os.replace(tmp_path, file_path)
+
+            os.remove(compacting_path)
+
+            # данные те же, изменились только файлы — обновляем подпись свёртки
+            if month_rollup["seq"]:
+                month_rollup["source"] = self._source_signature(ym)
+                rollup.save_rollup(self.rollup_path(ym), month_rollup)
+
+        return file_path
+
+    def export_month(self, ym: str) -> str:
+        """Актуальный Excel месяца для отправки (/csv, /import YYYY-MM)."""
+        return self.compact_month(ym)
+
+    def settle(self, ym: str):
+        """После массовой записи (импорт) — сразу один раз пересобрать Excel месяца."""
+        self.compact_month(ym)
+
+    def maintain(self):
+        """Уплотняет все месяцы, у которых есть журнал (после старта и по таймеру)."""
+        for name in sorted(os.listdir(self.root)):
+            if name.endswith(".journal") or name.endswith(".journal.compacting"):
+                self.compact_month(name.split(".", 1)[0])
+
+    def delete_month(self, ym: str):
+        """Удаляет Excel, журналы и свёртку месяца."""
+        with self._locked(ym):
+            for path in (self.month_file(ym), self.journal_path(ym),
+                         self._compacting_path(ym), self.rollup_path(ym)):
+                if os.path.exists(path):
+                    os.remove(path)
+            self._next_seq.pop(ym, None)
+            self._rollups.pop(ym, None)
+            self._bump_version(ym)
+
+    def months(self) -> list[str]:
+        """Месяцы, по которым есть данные (YYYY-MM, по возрастанию)."""
+        out = set()
+        for name in os.listdir(self.root):
+            ym, _, ext = name.partition(".")
+            if ext in ("xlsx", "journal", "journal.compacting") and len(ym) == 7:
+                out.add(ym)
+        return sorted(out)
+
+    def iter_rows(self, ym: str):
+        """Все строки месяца (Excel + ещё не уплотнённый журнал) — для переноса в другое хранилище."""
+        with self._locked(ym):
+            done = 0
+            file_path = self.month_file(ym)
+            if os.path.exists(file_path):
+                from openpyxl import load_workbook
+
+                wb = load_workbook(file_path, read_only=True)
+                done = _workbook_seq(wb)
+                rows = [list(r) for r in wb.active.iter_rows(min_row=2, values_only=True)]
+                wb.close()
+            else:
+                rows = []
+            rows.extend(row for _s, row in self._journal_records_after(ym, done))
+        return rows
+
+    # ── свёртка месяца (см. rollup.py) ───────────────────────────────────────
+    def _rebuild_rollup(self, ym: str) -> dict:
+        """Полная пересборка свёртки: Excel (потоково) + ещё не уплотнённый журнал."""
+        month_rollup = rollup.empty_rollup()
+        done = 0
+        file_path = self.month_file(ym)
+        if os.path.exists(file_path):
+            from openpyxl import load_workbook
+
+            wb = load_workbook(file_path, read_only=True)
+            done = _workbook_seq(wb)
+            rollup.add_rows(month_rollup, wb.active.iter_rows(min_row=2, values_only=True))
+            wb.close()
+
+        last = done
+        for seq, row in self._journal_records_after(ym, done):
+            rollup.add_rows(month_rollup, [row])
+            last = max(last, seq)
+        month_rollup["seq"] = last
+        return month_rollup
+
+    def _source_signature(self, ym: str) -> list:
+        """Размер и mtime файлов месяца (Excel, журнал, уплотняемый журнал) — отпечаток для свёртки."""
+        sig = []
+        for path in (self.month_file(ym), self.journal_path(ym), self._compacting_path(ym)):
+            try:
+                st = os.stat(path)
+                sig.append([st.st_size, st.st_mtime_ns])
+            except FileNotFoundError:
+                sig.append(None)
+        return sig
+
+    def _get_rollup(self, ym: str) -> dict:
+        """
+        Свёртка месяца из памяти или с диска. Если отпечаток файлов месяца совпадает
+        с сохранённым в свёртке — она берётся как есть, без чтения Excel и журнала.
+        Иначе, если Excel не менялся, недостающие записи догоняются из журнала;
+        изменённый Excel или пропуски в журнале — свёртка пересобирается потоковым чтением.
+        Вызывать под _locked(ym).
+        """
+        month_rollup = self._rollups.get(ym)
+        if month_rollup is not None:
+            return month_rollup
+
+        path = self.rollup_path(ym)
+        month_rollup = rollup.load_rollup(path)
+        signature = self._source_signature(ym)
+        if month_rollup is not None and month_rollup.get("source") == signature:
+            self._next_seq.setdefault(ym, month_rollup["seq"] + 1)
+            self._rollups[ym] = month_rollup
+            return month_rollup
+
+        # журнал объясняет только дописанные отчёты; Excel, изменённый не нами
+        # (правка руками, копия с другого хоста), — только пересборкой
+        source = (month_rollup or {}).get("source")
+        if not source or source[0] != signature[0]:
+            month_rollup = None
+
+        last = self._last_seq(ym)
+
+        if month_rollup is not None and month_rollup["seq"] < last:
+            missing = self._journal_records_after(ym, month_rollup["seq"])
+            if len(missing) == last - month_rollup["seq"]:
+                rollup.add_rows(month_rollup, [row for _s, row in missing])
+                month_rollup["seq"] = last
+            else:
+                month_rollup = None
+
+        if month_rollup is None or month_rollup["seq"] != last:
+            month_rollup = self._rebuild_rollup(ym)
+        if month_rollup["seq"]:
+            month_rollup["source"] = self._source_signature(ym)
+            rollup.save_rollup(path, month_rollup)
+
+        self._rollups[ym] = month_rollup
+        return month_rollup
+
+    def key_totals(self, ym: str) -> tuple[dict, dict]:
+        """Итоги месяца по ключам пользователей и их имена — из свёртки."""
+        with self._locked(ym):
+            return rollup.key_totals(self._get_rollup(ym))
+
+    def user_totals(self, ym: str) -> dict:
+        """Итоги месяца по пользователям (формат user_stats) — из свёртки."""
+        return rollup.display_totals(*self.key_totals(ym))
+
+    def daily_totals(self, ym: str) -> list[tuple[str, float, float]]:
+        """Вес и отходы месяца по дням — из свёртки."""
+        with self._locked(ym):
+            return rollup.daily_totals(self._get_rollup(ym))
@@ -0,0 +1,57 @@
+import asyncio
+import os
+
+from aggregates import MonthAggregates
+from anomaly import AnomalyDetector
+from charts import GrafCache
+from concurrency import SharedLock
+from data_utils import month_key_totals, partition_dir
+
+
+def doc_key(partition: str | None, ym: str) -> str:
+    """Ключ месяца в DocumentCache: у каждого цеха свои файлы и свои file_id."""
+    return ym if partition is None else f"{partition}/{ym}"
+
+
+# ────────────────────────────────────────────────
+# Цех: раздел данных одного чата и его состояние в памяти
+# ────────────────────────────────────────────────
+class Hall:
+    """
+    Всё, что относится к одному цеху (разделу данных, см. data_utils.partition_dir):
+    • stats — оперативные итоги текущего месяца (загружаются при первом обращении);
+    • lock — запись отчётов совместно, /import исключительно (см. SharedLock);
+    • graf_cache — готовые графики /graf этого цеха;
+    • anomalies — потоковая статистика долей отходов (anomaly.json раздела).
+    Создаётся при первом апдейте из чата, поэтому память растёт с числом активных цехов.
+    """
+
+    __slots__ = ("partition", "stats", "lock", "graf_cache", "anomalies", "loaded", "_load_lock")
+
+    def __init__(self, partition: str | None, anomaly_threshold: float = 3.0, anomaly_warmup: int = 10):
+        self.partition = partition
+        self.stats = MonthAggregates()
+        self.lock = SharedLock()
+        self.graf_cache = GrafCache()
+        self.anomalies = AnomalyDetector(
+            os.path.join(partition_dir(partition), "anomaly.json"), anomaly_threshold, anomaly_warmup
+        )
+        self.loaded = False
+        self._load_lock = asyncio.Lock()
+
+    def load(self, ym: str):
+        """Синхронная загрузка итогов месяца (старт бота, до event loop)."""
+        self.stats.load(*month_key_totals(ym, self.partition))
+        self.loaded = True
+
+    async def month_stats(self, ym: str) -> MonthAggregates:
+        """Итоги текущего месяца; при первом обращении читаются из хранилища (вне event loop)."""
+        if not self.loaded:
+            async with self._load_lock:
+                if not self.loaded:
+                    self.stats.load(*await asyncio.to_thread(month_key_totals, ym, self.partition))
+                    self.loaded = True
+        return self.stats
+
+    def doc_key(self, ym: str) -> str:
+        return doc_key(self.partition, ym)
@@ -1,23 +1,46 @@
+import time
+
+_STARTED = time.perf_counter()  # для замера холодного старта
+
 import asyncio
+from concurrent.futures.process import BrokenProcessPool
+import io
 from datetime import datetime, timedelta, date as _date
 import os
+import secrets
+from urllib.parse import urlsplit
 
-import matplotlib.pyplot as plt
-import pandas as pd
-from openpyxl import load_workbook
 from telegram import (
     ReplyKeyboardMarkup,
     ReplyKeyboardRemove,
     KeyboardButton,
     InlineKeyboardMarkup,
     InlineKeyboardButton,
+    InputMediaPhoto,
     Update,
     BotCommand,
 )
+from telegram.error import BadRequest
 from telegram.ext import ApplicationBuilder, MessageHandler, filters, CommandHandler, CallbackQueryHandler
 
-from parser import parse_message
-from data_utils import save_entry, generate_stats, get_csv_file, get_month_file_str
+from parser import build_report, is_valid_report, report_values
+from data_utils import (
+    DATA_DIR, save_entries, generate_stats, export_month, settle_month, maintain_storage, delete_month, import_workbook,
+    get_month_version, month_user_totals, month_key_totals, month_files, parse_month_range, range_totals, partitions,
+)
+from halls import Hall, doc_key
+from anomaly import describe as describe_anomaly
+import rollup
+from writer import ReportWriter
+from pending_store import PendingStore
+from charts import ChartPool, ChartBusyError
+from doc_cache import DocumentCache
+from scheduler import DeadlineScheduler
+from outbox import Outbox
+from concurrency import ChatOrderedProcessor
+import metrics
+from profiler import Profiler
+from tracing import TraceBuffer
 
 # ────────────────────────────────────────────────
 # Конфигурация и доступ
@@ -42,11 +65,74 @@ if not ALLOWED_USER_IDS:
 else:
     print(f"[INFO] Разрешенные ID: {sorted(ALLOWED_USER_IDS)}")
 
-user_stats: dict[str, dict] = {}
+
+def _env_int(name: str, default: int) -> int:
+    try:
+        return int(os.getenv(name, "") or default)
+    except ValueError:
+        print(f"[WARN] {name} должен быть числом — используется {default}")
+        return default
+
+
+def _env_float(name: str, default: float) -> float:
+    try:
+        return float(os.getenv(name, "") or default)
+    except ValueError:
+        print(f"[WARN] {name} должен быть числом — используется {default}")
+        return default
+
+
+# Получение обновлений: polling (по умолчанию) или webhook — локальный HTTP-сервер
+# на WEBHOOK_PORT (host_network, порт хоста). WEBHOOK_URL — публичный https-адрес
+# (обычно через обратный прокси), который регистрируется в Telegram.
+UPDATE_MODE = (os.getenv("UPDATE_MODE", "") or "polling").strip().lower()
+WEBHOOK_PORT = _env_int("WEBHOOK_PORT", 8443)
+WEBHOOK_PATH = (os.getenv("WEBHOOK_PATH", "") or "bnk_bot").strip("/")
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET", "") or secrets.token_urlsafe(32)
+WEBHOOK_URL = os.getenv("WEBHOOK_URL", "").strip()
+
+# Клиент Bot API: адрес сервера (свой Bot API server или тестовый) и размер пула соединений
+BOT_API_URL = os.getenv("BOT_API_URL", "").strip()
+BOT_API_POOL_SIZE = _env_int("BOT_API_POOL_SIZE", 16)
+
+# Метрики Prometheus: GET http://<хост>:METRICS_PORT/metrics (0 — выключено)
+METRICS_PORT = _env_int("METRICS_PORT", 0)
+
+# Апдейты разных чатов обрабатываются параллельно (не больше стольких хэндлеров
+# одновременно), одного чата — по порядку
+MAX_CONCURRENT_UPDATES = max(_env_int("MAX_CONCURRENT_UPDATES", 16), 1)
+
+# Цеха: при CHAT_PARTITIONS у каждого чата свой раздел данных (DATA_DIR/chats/<chat_id>),
+# свои итоги и графики. Чат PRIMARY_CHAT_ID пишет в сам DATA_DIR — там прежняя история.
+CHAT_PARTITIONS = os.getenv("CHAT_PARTITIONS", "").strip().lower() in ("1", "true", "yes", "on")
+PRIMARY_CHAT_ID = _env_int("PRIMARY_CHAT_ID", 0)
+
+# Необычные смены: доля отходов/экструзии дальше ANOMALY_THRESHOLD σ от обычной
+# (0 — не отмечать); первые ANOMALY_WARMUP смен пользователя сравниваются с цехом
+ANOMALY_THRESHOLD = _env_float("ANOMALY_THRESHOLD", 3.0)
+ANOMALY_WARMUP = _env_int("ANOMALY_WARMUP", 10)
+
+halls: dict[str | None, Hall] = {}  # раздел → состояние цеха (создаётся по первому апдейту)
 current_month = datetime.now().month
-pending_updates: dict[int, dict] = {}
+# (chat_id, message_id) → {chat_id, user, user_id, values, time}: номера сообщений у каждого чата свои
+pending_updates: dict[tuple[int, int], dict] = {}
+pending_store = PendingStore(os.path.join(DATA_DIR, "pending.jsonl"))  # копия pending_updates на диске (пишется в потоке)
+bot = None  # задаётся в _post_init
+writer = ReportWriter()  # все записи отчётов идут через одну фоновую очередь
+chart_pool = ChartPool()  # /graf рендерится в отдельном процессе
+outbox = Outbox()  # подтверждения отчётов: лимиты Telegram и склейка по чату
+profiler = Profiler()  # /profile: cProfile + tracemalloc по запросу
+traces = TraceBuffer(capacity=1000)  # /latency: этапы последних отчётов
+doc_cache = DocumentCache(os.path.join(DATA_DIR, "file_ids.json"))  # file_id отправленных Excel (ключ — Hall.doc_key)
+update_processor = ChatOrderedProcessor(MAX_CONCURRENT_UPDATES)
 
 SAVE_DELAY = timedelta(minutes=2)  # задержка перед записью/отправкой
+SAVE_RETRY_DELAY = timedelta(seconds=30)  # повтор неудавшейся записи: 30 с, 1 мин, 2 мин… (удвоение)
+SAVE_RETRY_MAX = timedelta(minutes=15)
+PROFILE_DEFAULT_SECONDS = 60   # /profile без аргумента
+PROFILE_MAX_SECONDS = 600
+COMPACT_INTERVAL = timedelta(minutes=15)  # как часто переносить журнал отчётов в Excel
+IMPORT_PROGRESS_EVERY = 3  # сек между сообщениями о ходе долгого /import
 
 
 # ────────────────────────────────────────────────
@@ -67,50 +153,32 @@ def is_allowed(update: Update) -> bool:
     return user_id in ALLOWED_USER_IDS
 
 
-def is_valid_report(text: str) -> bool:
-    """Фильтр отчёта: требуем присутствие ключевых слов."""
-    t = text.lower()
-    groups = [
-        ["паков", "паки", "упаков"],
-        ["вес"],
-        ["отход"],
-        ["пакетосвар"],
-        ["экструз", "экструд"],
-    ]
-    return all(any(v in t for v in grp) for grp in groups)
+def partition_of(chat_id: int) -> str | None:
+    """Раздел данных чата: None — основной DATA_DIR."""
+    if not CHAT_PARTITIONS or chat_id == PRIMARY_CHAT_ID:
+        return None
+    return str(chat_id)
 
 
-def load_stats_from_excel():
-    """Загружает статистику из текущего Excel в user_stats при старте."""
-    file_path = get_csv_file()
-    if not os.path.exists(file_path):
-        return
+def _hall(partition: str | None) -> Hall:
+    hall = halls.get(partition)
+    if hall is None:
+        hall = halls[partition] = Hall(partition, ANOMALY_THRESHOLD, ANOMALY_WARMUP)
+    return hall
 
-    user_stats.clear()
-    wb = load_workbook(file_path)
-    ws = wb.active
 
-    for row in ws.iter_rows(min_row=2, values_only=True):
-        _date_cell, user, pakov, ves, paket, flexa, extru, itogo = row
-        if not user:
-            continue
-
-        if user not in user_stats:
-            user_stats[user] = {
-                'Паков': 0.0, 'Вес': 0.0, 'Пакетосварка': 0.0,
-                'Флекса': 0.0, 'Экструзия': 0.0, 'Итого': 0.0, 'Смен': 0
-            }
+def hall_of(chat_id: int) -> Hall:
+    return _hall(partition_of(chat_id))
 
-        # инкремент смен на каждую строку
-        user_stats[user]['Смен'] += 1
 
-        # накопительные метрики
-        user_stats[user]['Паков']        += safe_float(pakov)
-        user_stats[user]['Вес']          += safe_float(ves)
-        user_stats[user]['Пакетосварка'] += safe_float(paket)
-        user_stats[user]['Флекса']       += safe_float(flexa)
-        user_stats[user]['Экструзия']    += safe_float(extru)
-        user_stats[user]['Итого']        += safe_float(itogo)
+def load_stats():
+    """
+    Загружает статистику текущего месяца основного раздела при старте — из свёртки,
+    сверенной с размером/mtime файлов месяца (Excel читается только при расхождении),
+    или агрегатом по индексу SQLite. Остальные цеха — при первом обращении.
+    Обслуживание хранилища — уже после старта, в _compact_loop.
+    """
+    _hall(None).load(cur_month_str())
 
 
 # ────────────────────────────────────────────────
@@ -139,37 +207,51 @@ def cur_month_str(today: _date | None = None) -> str:
 # ────────────────────────────────────────────────
 # Сохранение отчёта с задержкой (debounce)
 # ────────────────────────────────────────────────
-async def delayed_save(message_id: int):
+@profiler.track
+async def delayed_save(key: tuple[int, int]):
+    """
+    Сохраняет отчёт (chat_id, message_id), чей срок ожидания истёк, и отправляет подтверждение в чат.
+    Если записать не удалось, отчёт возвращается в очередь (он и так лежит в pending_store)
+    с растущей задержкой, а чат узнаёт, что отчёт пока не сохранён.
+    """
+    saved = False
     try:
-        await asyncio.sleep(SAVE_DELAY.total_seconds())
-        if message_id not in pending_updates:
+        if key not in pending_updates:
             return
 
-        data = pending_updates.pop(message_id)
-        bot = data["context"].bot
+        data = pending_updates.pop(key)
+        traces.mark(key, "due")
         chat_id = data["chat_id"]
         username = data["user"]
         values = data["values"]
-
-        # 1) Сохраняем в Excel (файл текущего месяца)
-        save_entry(data["time"], username, values)
-
-        # 2) Обновляем оперативную статистику
-        user_stats.setdefault(username, {
-            'Паков': 0.0, 'Вес': 0.0, 'Пакетосварка': 0.0,
-            'Флекса': 0.0, 'Экструзия': 0.0, 'Итого': 0.0, 'Смен': 0
-        })
-        for k, v in values.items():
-            if k in user_stats[username] and isinstance(v, (int, float)):
-                user_stats[username][k] += v
-        user_stats[username]['Смен'] += 1
-
-        total_pakov_all = sum(u.get('Паков', 0.0) for u in user_stats.values())
-        total_ves_all = sum(u.get('Вес', 0.0) for u in user_stats.values())
+        hall = hall_of(chat_id)
+
+        # запись с пополнением итогов — совместно с другими отчётами цеха, но не во время его /import
+        async with hall.lock.shared():
+            # итоги берём до записи: загруженные после неё уже содержали бы этот отчёт
+            month_stats = await hall.month_stats(cur_month_str())
+
+            # 1) Сохраняем (пачкой с соседними отчётами, вне event loop)
+            await writer.submit(data["time"], username, values, data.get("user_id"), hall.partition)
+            saved = True
+            traces.mark(key, "saved")
+            pending_store.drop(key)
+            doc_cache.invalidate(hall.doc_key(data["time"].strftime('%Y-%m')))
+
+            # 2) Обновляем оперативную статистику
+            #    (отчёт прошлого месяца, сохранённый уже после смены месяца, в неё не входит)
+            if data["time"].month == current_month:
+                month_stats.add(data.get("user_id"), username, values)
+
+            totals = month_stats.totals()
+            # доли отходов сравниваются с историей пользователя/цеха и пополняют её — O(1)
+            anomalies = hall.anomalies.observe(rollup.user_key(username, data.get("user_id")), values)
+        total_pakov_all = totals['Паков']
+        total_ves_all = totals['Вес']
 
         # 3) Сообщение в чат
         report = f"""
-📦 Отчёт за смену:
+📦 Отчёт за смену — {username}:
 
 📦  Паков: {values.get('Паков', 0.0):.2f} шт
 ⚖️ Вес: {values.get('Вес', 0.0):.2f} кг
@@ -183,32 +265,104 @@ async def delayed_save(message_id: int):
 
 📊 Всего продукции за период: {total_pakov_all:.2f} паков / {total_ves_all:.2f} кг
 """.strip()
+        if anomalies:
+            report += "\n\n" + "\n".join(describe_anomaly(a, username) for a in anomalies)
+            for a in anomalies:
+                metrics.ANOMALIES.inc(a[0])
 
-        await bot.send_message(chat_id=chat_id, text=report)
+        # подтверждения, сработавшие в чат почти одновременно, уйдут одним сообщением
+        outbox.send(chat_id, report, coalesce=True, on_sent=lambda: traces.finish(key))
 
     except Exception as e:
         import traceback
         print("delayed_save error:", e)
         print(traceback.format_exc())
         try:
-            await data["context"].bot.send_message(
-                chat_id=data.get("chat_id"),
-                text=f"✅ Отчёт сохранён, но ошибка при отправке сообщения: {e}"
-            )
+            if not saved:
+                _retry_save(key, data, e)
+            else:
+                outbox.send(data.get("chat_id"), f"✅ Отчёт сохранён, но ошибка при отправке сообщения: {e}")
         except Exception:
             pass
 
 
+def _retry_save(key: tuple[int, int], data: dict, error: Exception):
+    """Запись не удалась: отчёт — снова в ожидание, повтор с удвоением задержки."""
+    attempt = data["attempts"] = data.get("attempts", 0) + 1
+    delay = min(SAVE_RETRY_DELAY.total_seconds() * 2 ** (attempt - 1), SAVE_RETRY_MAX.total_seconds())
+    pending_updates.setdefault(key, data)
+    _schedule_save(key, delay)
+    if attempt == 1:  # о повторах не сообщаем — подтверждение придёт, когда запись пройдёт
+        outbox.send(
+            data["chat_id"],
+            f"❌ Отчёт {data['user']} не сохранён: {error}. Повторю запись автоматически.",
+        )
+
+
+async def flush_due_reports(keys: list[tuple[int, int]]):
+    """Все отчёты, чей срок наступил одновременно, уходят писателю одной пачкой."""
+    await asyncio.gather(*(delayed_save(key) for key in keys))
+
+
+save_scheduler = DeadlineScheduler(flush_due_reports)
+
+
+def _schedule_save(key: tuple[int, int], delay: float):
+    """Ставит (или переносит) сохранение отчёта и фиксирует его в очереди на диске."""
+    pending_store.put(key, pending_updates[key], time.time() + delay)
+    save_scheduler.schedule(key, delay)
+
+
+async def restore_pending():
+    """После перезапуска возвращает ожидавшие отчёты с оставшейся задержкой."""
+    restored = await asyncio.to_thread(pending_store.load)
+    now = time.time()
+    for key, (data, due) in restored.items():
+        pending_updates[key] = data
+        save_scheduler.schedule(key, max(due - now, 0.0))
+    if pending_updates:
+        print(f"[INFO] Восстановлено ожидающих отчётов: {len(pending_updates)}")
+
+
+async def flush_pending_now():
+    """Остановка аддона: все ожидающие отчёты сразу пишутся в хранилище, без задержки."""
+    if not pending_updates:
+        return
+    keys = list(pending_updates)
+    by_hall: dict[str | None, list] = {}
+    for d in pending_updates.values():
+        by_hall.setdefault(partition_of(d["chat_id"]), []).append((d["time"], d["user"], d["values"], d.get("user_id")))
+        # подтверждения уже не будет, но статистику долей отходов пополняем
+        hall_of(d["chat_id"]).anomalies.observe(rollup.user_key(d["user"], d.get("user_id")), d["values"])
+    for partition, entries in by_hall.items():
+        await asyncio.to_thread(save_entries, entries, partition)
+        for ym in {entry[0].strftime('%Y-%m') for entry in entries}:
+            doc_cache.invalidate(doc_key(partition, ym))
+    for key in keys:
+        pending_updates.pop(key, None)
+        pending_store.drop(key)
+    print(f"[INFO] При остановке сохранено ожидающих отчётов: {len(keys)}")
+
+
+def _settle_all(ym: str):
+    for partition in partitions():
+        settle_month(ym, partition)
+
+
 # ────────────────────────────────────────────────
 # Хэндлеры сообщений
 # ────────────────────────────────────────────────
+@profiler.track
 async def handle_message(update, context):
     global current_month
     month_now = datetime.now().month
     if month_now != current_month:
-        user_stats.clear()
-        pending_updates.clear()
+        # ожидающие отчёты не трогаем: каждый сохранится в месяц своей даты
+        for hall in halls.values():
+            hall.stats.clear()
         current_month = month_now
+        # закрытый месяц больше не пополняется — сразу собираем его Excel во всех цехах
+        asyncio.create_task(asyncio.to_thread(_settle_all, prev_month_str()))
 
     if not update.message or not update.message.text:
         return
@@ -220,64 +374,47 @@ async def handle_message(update, context):
     # Всё перенесено в отдельную команду /importmenu
 
     # Обычный отчёт
-    if not is_valid_report(text):
-        return
-
-    values = parse_message(text)
-    if not values:
-        return
-
-    # минимум 3 непустых поля
-    if sum(1 for v in values.values() if v not in (0, "", None)) < 3:
+    trace = traces.begin(update.message.date.timestamp() if update.message.date else None)
+    with metrics.PARSE_SECONDS.time():
+        if not is_valid_report(text):
+            return
+        trace.mark("valid")
+        values = report_values(text)
+        trace.mark("parsed")
+    if values is None:
         return
 
-    for key in ["Паков", "Вес", "Пакетосварка", "Флекса", "Экструзия"]:
-        values.setdefault(key, 0.0)
-
-    values["Итого"] = (
-        safe_float(values.get("Пакетосварка", 0))
-        + safe_float(values.get("Флекса", 0))
-        + safe_float(values.get("Экструзия", 0))
-    )
-
-    message_id = update.message.message_id
-    pending_updates[message_id] = {
+    key = (update.effective_chat.id, update.message.message_id)
+    pending_updates[key] = {
         "user": username,
+        "user_id": update.effective_user.id,
         "values": values,
         "time": datetime.now(),
         "chat_id": update.effective_chat.id,
-        "context": context
     }
 
-    asyncio.create_task(delayed_save(message_id))
+    _schedule_save(key, SAVE_DELAY.total_seconds())
+    trace.mark("queued")
+    traces.open(key, trace, username)
 
 
 async def handle_edited_message(update, context):
     if not update.edited_message or not update.edited_message.text:
         return
-    message_id = update.edited_message.message_id
-    if message_id not in pending_updates:
+    # правка ищет отчёт своего чата: тот же message_id в другом цехе — другое сообщение
+    key = (update.edited_message.chat_id, update.edited_message.message_id)
+    if key not in pending_updates:
         return
 
-    text = update.edited_message.text
-    if not is_valid_report(text):
+    values = build_report(update.edited_message.text)
+    if values is None:
         return
 
-    values = parse_message(text)
-    if sum(1 for v in values.values() if v not in (0, "", None)) < 3:
-        return
-
-    for key in ["Паков", "Вес", "Пакетосварка", "Флекса", "Экструзия"]:
-        values.setdefault(key, 0.0)
-
-    values["Итого"] = (
-        safe_float(values.get("Пакетосварка", 0))
-        + safe_float(values.get("Флекса", 0))
-        + safe_float(values.get("Экструзия", 0))
-    )
-
-    pending_updates[message_id]["values"] = values
-    pending_updates[message_id]["time"] = datetime.now()
+    pending_updates[key]["values"] = values
+    pending_updates[key]["time"] = datetime.now()
+    # правка сбрасывает таймер: отсчёт SAVE_DELAY начинается заново
+    _schedule_save(key, SAVE_DELAY.total_seconds())
+    traces.mark(key, "edited")
 
 
 # ────────────────────────────────────────────────
@@ -302,6 +439,32 @@ async def cmd_hide(update, context):
         reply_markup=ReplyKeyboardRemove()
     )
 
+async def send_month_file(chat_id: int, ym: str) -> bool:
+    """
+    Отправляет Excel месяца цеха этого чата. Неизменённый с прошлой отправки файл
+    уходит по file_id, без повторной загрузки. False — данных за месяц нет.
+    """
+    hall = hall_of(chat_id)
+    key = hall.doc_key(ym)
+    file_path = await asyncio.to_thread(export_month, ym, hall.partition)
+    if not os.path.exists(file_path):
+        return False
+
+    file_id, stamp = await asyncio.to_thread(doc_cache.lookup, key, file_path)
+    if file_id:
+        try:
+            await bot.send_document(chat_id=chat_id, document=file_id)
+            return True
+        except BadRequest:
+            doc_cache.invalidate(key)  # file_id больше не принимается — грузим заново
+            file_id, stamp = await asyncio.to_thread(doc_cache.lookup, key, file_path)
+
+    with open(file_path, "rb") as f:
+        msg = await bot.send_document(chat_id=chat_id, document=f, filename=f"BNK_{ym}.xlsx")
+    doc_cache.remember(key, stamp, msg.document.file_id)
+    return True
+
+
 # /csv или /csv YYYY-MM
 async def cmd_csv(update, context):
     if not is_allowed(update):
@@ -320,43 +483,52 @@ async def cmd_csv(update, context):
             )
             return
 
-        file_path = get_month_file_str(ym)
-        if not os.path.exists(file_path):
+        if not await send_month_file(update.effective_chat.id, ym):
             await context.bot.send_message(chat_id=update.effective_chat.id, text=f"Файл за {ym} не найден.")
-            return
-
-        await context.bot.send_document(
-            chat_id=update.effective_chat.id,
-            document=open(file_path, "rb"),
-            filename=f"BNK_{ym}.xlsx"
-        )
         return
 
     # текущий месяц
-    file_path = get_csv_file()
-    if not os.path.exists(file_path):
+    if not await send_month_file(update.effective_chat.id, cur_month_str()):
         await context.bot.send_message(chat_id=update.effective_chat.id, text="❌ Файл данных не найден.")
-        return
 
-    await context.bot.send_document(
-        chat_id=update.effective_chat.id,
-        document=open(file_path, 'rb'),
-        filename=f"BNK_{datetime.now():%Y-%m}.xlsx"
-    )
+async def _parse_range_args(update, context, command: str) -> list[str] | None:
+    """Аргументы FROM..TO команды → список месяцев; при ошибке отвечает подсказкой и возвращает None."""
+    try:
+        return parse_month_range(" ".join(context.args))
+    except ValueError:
+        await context.bot.send_message(
+            chat_id=update.effective_chat.id,
+            text=f"Неверный диапазон. Использование: /{command} или /{command} YYYY-MM..YYYY-MM "
+                 f"(например, /{command} 2025-01..2025-12)"
+        )
+        return None
 
+
+# /stats или /stats FROM..TO
 async def cmd_stats(update, context):
     if not is_allowed(update):
         await context.bot.send_message(chat_id=update.effective_chat.id, text="⛔ Нет доступа.")
         return
-    await context.bot.send_message(chat_id=update.effective_chat.id, text=generate_stats(user_stats))
+
+    if context.args:  # /stats 2025-01..2025-12
+        months = await _parse_range_args(update, context, "stats")
+        if months is None:
+            return
+        users, _daily = await asyncio.to_thread(range_totals, months, partition_of(update.effective_chat.id))
+        period = months[0] if len(months) == 1 else f"{months[0]}..{months[-1]}"
+        await context.bot.send_message(chat_id=update.effective_chat.id, text=generate_stats(users, period))
+        return
+
+    month_stats = await hall_of(update.effective_chat.id).month_stats(cur_month_str())
+    await context.bot.send_message(chat_id=update.effective_chat.id, text=generate_stats(month_stats.user_stats()))
 
 async def cmd_reset(update, context):
     if not is_allowed(update):
         await context.bot.send_message(chat_id=update.effective_chat.id, text="⛔ Нет доступа.")
         return
-    user_stats.clear()
-    pending_updates.clear()
-    await context.bot.send_message(chat_id=update.effective_chat.id, text="♻️ Статистика и буфер сброшены!")
+    # ожидающие отчёты не выбрасываем — они сохранятся в свой срок
+    (await hall_of(update.effective_chat.id).month_stats(cur_month_str())).clear()
+    await context.bot.send_message(chat_id=update.effective_chat.id, text="♻️ Статистика сброшена!")
 
 async def cmd_myid(update, context):
     if update.message.chat.type != "private":
@@ -392,16 +564,8 @@ async def cmd_import_month(update, context):
         )
         return
 
-    file_path = get_month_file_str(ym)
-    if not os.path.exists(file_path):
+    if not await send_month_file(update.effective_chat.id, ym):
         await context.bot.send_message(chat_id=update.effective_chat.id, text=f"Файл за {ym} не найден.")
-        return
-
-    await context.bot.send_document(
-        chat_id=update.effective_chat.id,
-        document=open(file_path, "rb"),
-        filename=f"BNK_{ym}.xlsx"
-    )
 
 # Старый импорт: отправить Excel с подписью /import
 async def cmd_import(update, context):
@@ -418,69 +582,47 @@ async def cmd_import(update, context):
         )
         return
 
-    # Удалим текущий Excel-файл и сбросим статистику
-    from pathlib import Path
-    current_file = Path(get_csv_file())
-    if current_file.exists():
-        current_file.unlink()
-        user_stats.clear()
-
     file = await msg.document.get_file()
-    file_path = "/tmp/imported.xlsx"
-    await file.download_to_drive(file_path)
+    data = bytes(await file.download_as_bytearray())
+
+    # отчёты цеха на время импорта ждут: их запись и пополнение итогов
+    # не должны попасть между удалением месяца и перечитыванием итогов
+    hall = hall_of(update.effective_chat.id)
+    async with hall.lock.exclusive():
+        # Удалим данные текущего месяца (Excel и журнал) и сбросим статистику
+        month_stats = await hall.month_stats(cur_month_str())
+        delete_month(cur_month_str(), hall.partition)
+        doc_cache.invalidate(hall.doc_key(cur_month_str()))
+        month_stats.clear()
 
-    try:
-        wb = load_workbook(file_path)
-        ws = wb.active
-        imported = 0
-
-        for row in ws.iter_rows(min_row=2, values_only=True):
-            date_str, user, pakov, ves, paket, flexa, extru, itogo = row
-            if not user:
-                continue
-
-            try:
-                if isinstance(date_str, str):
-                    date_obj = datetime.strptime(date_str, "%Y-%m-%d %H:%M")
+        try:
+            # читаем и пишем в отдельном потоке; если это надолго — показываем ход импорта
+            progress = {"rows": 0}
+            job = asyncio.create_task(asyncio.to_thread(import_workbook, data, progress, hall.partition))
+            status = None
+            while True:
+                done, _ = await asyncio.wait({job}, timeout=IMPORT_PROGRESS_EVERY)
+                if done:
+                    break
+                text = f"⏳ Импорт: прочитано строк {progress['rows']}…"
+                if status is None:
+                    status = await context.bot.send_message(chat_id=update.effective_chat.id, text=text)
                 else:
-                    date_obj = date_str
-            except Exception:
-                date_obj = datetime.now()
-
-            values = {
-                "Паков": pakov or 0,
-                "Вес": ves or 0,
-                "Пакетосварка": paket or 0,
-                "Флекса": flexa or 0,
-                "Экструзия": extru or 0,
-                "Итого": itogo or 0
-            }
-
-            save_entry(date_obj, user, values)
-
-            if user not in user_stats:
-                user_stats[user] = {
-                    'Паков': 0.0, 'Вес': 0.0, 'Пакетосварка': 0.0,
-                    'Флекса': 0.0, 'Экструзия': 0.0, 'Итого': 0.0, 'Смен': 0
-                }
-
-            user_stats[user]['Паков'] += float(values["Паков"])
-            user_stats[user]['Вес'] += float(values["Вес"])
-            user_stats[user]['Пакетосварка'] += float(values["Пакетосварка"])
-            user_stats[user]['Флекса'] += float(values["Флекса"])
-            user_stats[user]['Экструзия'] += float(values["Экструзия"])
-            user_stats[user]['Итого'] += float(values["Итого"])
-            user_stats[user]['Смен'] += 1
-
-            imported += 1
+                    await status.edit_text(text)
+            months = job.result()
+            for ym in months:
+                doc_cache.invalidate(hall.doc_key(ym))
 
-        await context.bot.send_message(
-            chat_id=update.effective_chat.id,
-            text=f"✅ Импорт завершён. Загружено и сохранено записей: {imported}"
-        )
+            ym = cur_month_str()
+            month_stats.load(*await asyncio.to_thread(month_key_totals, ym, hall.partition))
 
-    except Exception as e:
-        await context.bot.send_message(chat_id=update.effective_chat.id, text=f"❌ Ошибка при импорте: {e}")
+            await context.bot.send_message(
+                chat_id=update.effective_chat.id,
+                text=f"✅ Импорт завершён. Загружено и сохранено записей: {sum(months.values())}"
+            )
+
+        except Exception as e:
+            await context.bot.send_message(chat_id=update.effective_chat.id, text=f"❌ Ошибка при импорте: {e}")
 
 
 # Команда-меню для выбора месяца (инлайн-кнопки)
@@ -515,134 +657,196 @@ async def on_callback(update, context):
     await q.answer()
     if q.data.startswith("import_month:"):
         ym = q.data.split(":", 1)[1]
-        file_path = get_month_file_str(ym)
-        if not os.path.exists(file_path):
+        if not await send_month_file(update.effective_chat.id, ym):
             await q.edit_message_text(f"Файл за {ym} не найден.")
-            return
-        await context.bot.send_document(
-            chat_id=update.effective_chat.id,
-            document=open(file_path, "rb"),
-            filename=f"BNK_{ym}.xlsx"
-        )
 
 
 # ────────────────────────────────────────────────
 # Графики
 # ────────────────────────────────────────────────
+# /graf или /graf FROM..TO
+@profiler.track
 async def cmd_graf(update, context):
     if not is_allowed(update):
         await context.bot.send_message(chat_id=update.effective_chat.id, text="⛔ Нет доступа.")
         return
 
-    file_path = get_csv_file()
-    if not os.path.exists(file_path):
+    if context.args:  # /graf 2025-01..2025-12
+        months = await _parse_range_args(update, context, "graf")
+        if months is None:
+            return
+    else:
+        months = [cur_month_str()]
+    hall = hall_of(update.effective_chat.id)
+    key = months[0] if len(months) == 1 else f"{months[0]}..{months[-1]}"
+    version = tuple(get_month_version(ym, hall.partition) for ym in months)
+    cached = hall.graf_cache.get(key, version)
+    if cached:
+        try:
+            await context.bot.send_media_group(
+                chat_id=update.effective_chat.id,
+                media=[InputMediaPhoto(media=file_id) for file_id in cached]
+            )
+            return
+        except BadRequest:
+            hall.graf_cache.invalidate(key)  # file_id больше не принимается — рисуем и грузим заново
+
+    users, daily = await asyncio.to_thread(range_totals, months, hall.partition)
+    if not daily:
         await context.bot.send_message(chat_id=update.effective_chat.id, text="❌ Файл данных не найден.")
         return
 
-    df = pd.read_excel(file_path)
-    if df.empty:
+    try:
+        with metrics.GRAF_SECONDS.time():
+            images = await chart_pool.render(daily, users)
+    except ChartBusyError:
+        await context.bot.send_message(chat_id=update.effective_chat.id, text="⏳ Графики уже строятся, попробуйте через минуту.")
+        return
+    except asyncio.TimeoutError:
+        await context.bot.send_message(chat_id=update.effective_chat.id, text="⌛ Построение графиков заняло слишком много времени.")
+        return
+    except BrokenProcessPool:
+        await context.bot.send_message(chat_id=update.effective_chat.id, text="⚠️ Процесс графиков упал и перезапущен, попробуйте ещё раз.")
+        return
+
+    if not images:
         await context.bot.send_message(chat_id=update.effective_chat.id, text="❌ В файле нет данных.")
         return
 
-    df.columns = ["Дата", "Имя", "Паков", "Вес", "Пакетосварка", "Флекса", "Экструзия", "Итого"]
+    # все графики одним альбомом — один запрос к Bot API
+    messages = await context.bot.send_media_group(
+        chat_id=update.effective_chat.id,
+        media=[InputMediaPhoto(media=img, filename=f"graf{i}.png") for i, img in enumerate(images, 1)]
+    )
+    hall.graf_cache.put(key, version, [m.photo[-1].file_id for m in messages])
+
+
+# ────────────────────────────────────────────────
+# Задержки отчётов (/latency)
+# ────────────────────────────────────────────────
+async def cmd_latency(update, context):
+    if not is_allowed(update):
+        await context.bot.send_message(chat_id=update.effective_chat.id, text="⛔ Нет доступа.")
+        return
+    await context.bot.send_message(chat_id=update.effective_chat.id, text=traces.report())
+
+
+# ────────────────────────────────────────────────
+# Профилирование (/profile [секунд])
+# ────────────────────────────────────────────────
+async def cmd_profile(update, context):
+    if not is_allowed(update):
+        await context.bot.send_message(chat_id=update.effective_chat.id, text="⛔ Нет доступа.")
+        return
+    if profiler.active:
+        await context.bot.send_message(chat_id=update.effective_chat.id, text="🔬 Профилирование уже идёт.")
+        return
+
     try:
-        df["Дата"] = pd.to_datetime(df["Дата"])
-    except Exception:
-        pass
-
-    # ГРАФИК 1 — линия по дням
-    daily = df.groupby(df["Дата"].dt.date).agg({"Вес": "sum", "Итого": "sum"}).reset_index()
-
-    fig, ax = plt.subplots()
-    ax.plot(daily["Дата"], daily["Вес"], marker="o", label="Вес (кг)")
-    ax.plot(daily["Дата"], daily["Итого"], marker="o", label="Отходы (кг)")
-
-    ax.set_title("Производство и отходы по дням")
-    ax.set_xlabel("Дата")
-    ax.set_ylabel("Кг")
-    ax.legend()
-    ax.grid(True, alpha=0.25)
-    fig.autofmt_xdate()
-
-    ymin, ymax = ax.get_ylim()
-    dy = max(1, (ymax - ymin) * 0.02)
-    for x, y in zip(daily["Дата"], daily["Вес"]):
-        ax.text(x, y + dy, f"{y:.0f}", ha="center", va="bottom", fontsize=8)
-    for x, y in zip(daily["Дата"], daily["Итого"]):
-        ax.text(x, y + dy, f"{y:.0f}", ha="center", va="bottom", fontsize=8)
-
-    fig.tight_layout()
-    img1 = "/tmp/graf1_daily.png"
-    fig.savefig(img1)
-    plt.close(fig)
-    await context.bot.send_photo(chat_id=update.effective_chat.id, photo=open(img1, "rb"))
-
-    # ГРАФИК 2 — топ по весу
-    top_users = (
-        df.groupby("Имя")["Вес"]
-        .sum()
-        .sort_values(ascending=False)
-        .head(10)
+        seconds = int(context.args[0]) if context.args else PROFILE_DEFAULT_SECONDS
+    except ValueError:
+        seconds = 0
+    if not 1 <= seconds <= PROFILE_MAX_SECONDS:
+        await context.bot.send_message(
+            chat_id=update.effective_chat.id,
+            text=f"Использование: /profile [секунд], от 1 до {PROFILE_MAX_SECONDS} (по умолчанию {PROFILE_DEFAULT_SECONDS})"
+        )
+        return
+
+    profiler.start()
+    await context.bot.send_message(
+        chat_id=update.effective_chat.id,
+        text=f"🔬 Профилирование на {seconds} с… Отчёт придёт файлом."
     )
-    plt.figure()
-    plt.bar(top_users.index, top_users.values)
-    plt.title("ТОП производители по весу (кг)")
-    plt.xlabel("Пользователь")
-    plt.ylabel("Кг")
-    plt.xticks(rotation=45, ha="right")
-    for i, v in enumerate(top_users.values):
-        plt.text(i, v, f"{v:.0f}", ha="center", va="bottom")
-
-    plt.tight_layout()
-    img2 = "/tmp/graf2_top_weight.png"
-    plt.savefig(img2)
-    plt.close()
-    await context.bot.send_photo(chat_id=update.effective_chat.id, photo=open(img2, "rb"))
-
-    # ГРАФИК 3 — доля отходов
-    total_weight = float(df["Вес"].sum())
-    total_waste = float(df["Итого"].sum())
-    good = max(total_weight - total_waste, 0)
-
-    plt.figure()
-    plt.pie([good, total_waste],
-            labels=["Продукция", "Отходы"],
-            autopct="%1.1f%%",
-            startangle=90)
-    plt.axis("equal")
-    plt.title("Доля отходов в общей массе")
-    img3 = "/tmp/graf3_share.png"
-    plt.savefig(img3)
-    plt.close()
-    await context.bot.send_photo(chat_id=update.effective_chat.id, photo=open(img3, "rb"))
-
-    # ГРАФИК 4 — топ по браку
-    agg = df.groupby("Имя")[["Итого"]].sum().reset_index()
-    top_kg = agg.sort_values("Итого", ascending=False).head(10)
-
-    plt.figure()
-    plt.bar(top_kg["Имя"], top_kg["Итого"])
-    plt.title("Топ по браку (кг)")
-    plt.xlabel("Пользователь")
-    plt.ylabel("Брак, кг")
-    plt.xticks(rotation=45, ha="right")
-    for i, v in enumerate(top_kg["Итого"]):
-        plt.text(i, v, f"{v:.0f}", ha="center", va="bottom")
-
-    plt.tight_layout()
-    img4 = "/tmp/graf4_defect_kg.png"
-    plt.savefig(img4)
-    plt.close()
-    await context.bot.send_photo(chat_id=update.effective_chat.id, photo=open(img4, "rb"))
+    asyncio.create_task(_finish_profile(update.effective_chat.id, seconds))
+
+
+async def _finish_profile(chat_id: int, seconds: int):
+    await asyncio.sleep(seconds)
+    report = profiler.stop()
+    try:
+        await bot.send_document(
+            chat_id=chat_id,
+            document=io.BytesIO(report.encode("utf-8")),
+            filename=f"profile_{datetime.now():%Y-%m-%d_%H%M%S}.txt",
+        )
+    except Exception as e:
+        print("profile send error:", e)
+        print(report)
+
+
+# ────────────────────────────────────────────────
+# Метрики (/metrics)
+# ────────────────────────────────────────────────
+def _hall_label(partition: str | None) -> str:
+    return "main" if partition is None else partition
+
+
+def _month_file_bytes():
+    out = []
+    for partition in list(halls):  # цеха, с которыми бот работал после старта
+        for ym in (prev_month_str(), cur_month_str()):
+            for kind, path in month_files(ym, partition).items():
+                if os.path.exists(path):
+                    out.append(((_hall_label(partition), ym, kind), os.path.getsize(path)))
+    return out
+
+
+def _month_rows():
+    return [((_hall_label(partition), ym), sum(u.get("Смен", 0) for u in month_user_totals(ym, partition).values()))
+            for partition in list(halls) for ym in (prev_month_str(), cur_month_str())]
+
+
+metrics.Gauge("bnk_pending_reports", "Отчёты, ждущие SAVE_DELAY (pending_updates)", lambda: len(pending_updates))
+metrics.Gauge("bnk_outbox_messages", "Сообщения в очереди на отправку", lambda: len(outbox))
+metrics.Gauge("bnk_active_chats", "Чаты с апдейтами в обработке или в очереди", lambda: update_processor.active_chats)
+metrics.Gauge("bnk_month_file_bytes", "Размер файлов месяца", _month_file_bytes, labels=("hall", "month", "file"))
+metrics.Gauge("bnk_month_rows", "Отчётов в месяце", _month_rows, labels=("hall", "month"))
+metrics.Gauge("bnk_halls", "Цеха (разделы данных) в памяти", lambda: len(halls))
+
+
+# ────────────────────────────────────────────────
+# Фоновое обслуживание хранилища (уплотнение журнала / checkpoint WAL, статистика отходов)
+# ────────────────────────────────────────────────
+def _save_anomalies():
+    """Статистика долей отходов всех цехов — на диск (по таймеру и при остановке)."""
+    for hall in list(halls.values()):
+        try:
+            hall.anomalies.save()
+        except OSError as e:
+            print("anomaly save error:", e)
+
+
+async def _compact_loop():
+    # первый проход сразу после старта — подбираем журналы прошлого запуска
+    while True:
+        try:
+            await asyncio.to_thread(maintain_storage)
+        except Exception as e:
+            print("compact error:", e)
+        await asyncio.to_thread(_save_anomalies)
+        await asyncio.sleep(COMPACT_INTERVAL.total_seconds())
 
 
 # ────────────────────────────────────────────────
 # Регистрация команд в подсказках Telegram
 # ────────────────────────────────────────────────
 async def _post_init(app):
+    global bot
+    bot = app.bot
+    writer.start()
+    outbox.start(app.bot)
+    save_scheduler.start()
+    await restore_pending()
+    pending_store.start()
+    chart_pool.start()
+    app.bot_data["compact_task"] = asyncio.create_task(_compact_loop())
+    if METRICS_PORT:
+        app.bot_data["metrics_server"] = await metrics.start_server(METRICS_PORT)
+        print(f"[INFO] Метрики: http://0.0.0.0:{METRICS_PORT}/metrics")
     await app.bot.set_my_commands([
-        BotCommand("graf",       "Построить графики за месяц"),
-        BotCommand("stats",      "Показать сводную статистику"),
+        BotCommand("graf",       "Графики за месяц или диапазон FROM..TO"),
+        BotCommand("stats",      "Сводная статистика (или за диапазон FROM..TO)"),
         BotCommand("importmenu", "Меню выбора месяца (инлайн-кнопки)"),
         #BotCommand("import",     "Импорт месяца… (например: /import 2025-07)"),
         #BotCommand("csv",        "Скачать Excel (или /csv YYYY-MM)"),
@@ -650,24 +854,52 @@ async def _post_init(app):
         #BotCommand("reset",      "Сбросить оперативную статистику"),
         #BotCommand("menu",       "Показать меню с кнопками"),
         #BotCommand("hide",       "Скрыть меню"),
+        #BotCommand("profile",    "Профилирование на N секунд (админ)"),
+        #BotCommand("latency",    "Задержки по этапам отчёта (админ)"),
     ])
 
+    t_imports, t_stats = app.bot_data.get("startup_times", (0.0, 0.0))
+    print(
+        f"[INFO] Холодный старт: импорт модулей {t_imports:.2f} с, статистика {t_stats:.2f} с, "
+        f"готов к приёму обновлений через {time.perf_counter() - _STARTED:.2f} с"
+    )
+
+
+async def _post_stop(app):
+    # SIGTERM/остановка: таймер больше не нужен, всё ожидающее — сразу на диск
+    await save_scheduler.close()
+    await flush_pending_now()
+    await pending_store.close()
+    await asyncio.to_thread(_save_anomalies)
+    await outbox.close()  # бот ещё работает — досылаем подтверждения
+
+
+async def _post_shutdown(app):
+    if "metrics_server" in app.bot_data:
+        app.bot_data["metrics_server"].close()
+    await writer.close()
+    chart_pool.shutdown()
+
 
 # ────────────────────────────────────────────────
 # Точка входа
 # ────────────────────────────────────────────────
-def main():
-    if not TOKEN:
-        raise ValueError("TELEGRAM_TOKEN env variable is required")
-
-    load_stats_from_excel()
-
-    app = (
+def build_application():
+    """Приложение бота со всеми хэндлерами (без запуска получения обновлений)."""
+    builder = (
         ApplicationBuilder()
         .token(TOKEN)
+        .connection_pool_size(BOT_API_POOL_SIZE)
+        .pool_timeout(10.0)
+        .concurrent_updates(update_processor)  # чаты — параллельно, внутри чата — по порядку
         .post_init(_post_init)   # регистрируем команды для подсказок “/”
-        .build()
+        .post_stop(_post_stop)
+        .post_shutdown(_post_shutdown)
     )
+    if BOT_API_URL:
+        api_url = BOT_API_URL.rstrip("/")
+        builder = builder.base_url(f"{api_url}/bot").base_file_url(f"{api_url}/file/bot")
+    app = builder.build()
 
     # меню и клавиатура
     app.add_handler(CommandHandler("start", cmd_start_menu))
@@ -692,10 +924,49 @@ def main():
     app.add_handler(CallbackQueryHandler(on_callback))
 
     app.add_handler(CommandHandler("graf", cmd_graf))
-    app.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, handle_message))
+    app.add_handler(CommandHandler("profile", cmd_profile))
+    app.add_handler(CommandHandler("latency", cmd_latency))
+    # filters.TEXT пропускает и правки — отчётам нужны только новые сообщения, правки идут ниже
+    app.add_handler(MessageHandler(filters.UpdateType.MESSAGE & filters.TEXT & ~filters.COMMAND, handle_message))
     app.add_handler(MessageHandler(filters.UpdateType.EDITED_MESSAGE, handle_edited_message))
+    return app
+
+
+def _local_bot_api() -> bool:
+    """BOT_API_URL указывает на Bot API server на этом же хосте (ему годится http-адрес webhook на localhost)."""
+    return bool(BOT_API_URL) and urlsplit(BOT_API_URL).hostname in ("localhost", "127.0.0.1", "::1")
 
-    app.run_polling()
+
+def main():
+    if not TOKEN:
+        raise ValueError("TELEGRAM_TOKEN env variable is required")
+    if UPDATE_MODE == "webhook" and not WEBHOOK_URL and not _local_bot_api():
+        # Telegram принимает webhook только по https на публичном адресе — localhost он отклонит
+        raise ValueError("UPDATE_MODE=webhook требует WEBHOOK_URL — публичный https-адрес (или UPDATE_MODE=polling)")
+
+    t_imports = time.perf_counter() - _STARTED
+    t0 = time.perf_counter()
+    load_stats()
+    t_stats = time.perf_counter() - t0
+
+    app = build_application()
+    app.bot_data["startup_times"] = (t_imports, t_stats)
+
+    if UPDATE_MODE == "webhook":
+        # без WEBHOOK_URL сюда доходим только со своим Bot API server на этом хосте
+        webhook_url = WEBHOOK_URL or f"http://127.0.0.1:{WEBHOOK_PORT}/{WEBHOOK_PATH}"
+        print(f"[INFO] Режим webhook: порт {WEBHOOK_PORT}, путь /{WEBHOOK_PATH}, адрес {webhook_url}")
+        app.run_webhook(
+            listen="0.0.0.0",
+            port=WEBHOOK_PORT,
+            url_path=WEBHOOK_PATH,
+            secret_token=WEBHOOK_SECRET,
+            webhook_url=webhook_url,
+        )
+    else:
+        if UPDATE_MODE != "polling":
+            print(f"[WARN] неизвестный UPDATE_MODE={UPDATE_MODE!r}, используется polling")
+        app.run_polling()
 
 
 if __name__ == "__main__":
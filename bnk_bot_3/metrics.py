@@ -0,0 +1,145 @@
+import asyncio
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+
+# ──────────────────────────────────────────────────────────────────────────────
+# Метрики в текстовом формате Prometheus (GET /metrics на METRICS_PORT)
+# ──────────────────────────────────────────────────────────────────────────────
+# Свой минимальный реестр вместо prometheus_client: нужны лишь счётчики,
+# гистограммы и «опрашиваемые» показатели, а лишняя зависимость на Raspberry
+# ни к чему. Запись метрики — пара операций под блокировкой, потоки (запись
+# в хранилище идёт в пуле) и event loop пишут безопасно.
+_registry: list = []
+
+# секунды: от микросекунд (разбор текста) до десятков секунд (Excel, графики)
+DEFAULT_BUCKETS = (0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+
+def _fmt_labels(names: tuple, values: tuple, extra: str = "") -> str:
+    parts = [f'{n}="{str(v)}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+class Counter:
+    def __init__(self, name: str, doc: str, labels: tuple = ()):
+        self.name, self.doc, self.labels = name, doc, labels
+        self._values: dict[tuple, float] = {}
+        self._lock = threading.Lock()
+        _registry.append(self)
+
+    def inc(self, *label_values, amount: float = 1.0):
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0.0) + amount
+
+    def collect(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.doc}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for values, v in sorted(self._values.items()):
+                lines.append(f"{self.name}{_fmt_labels(self.labels, values)} {v}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name: str, doc: str, buckets: tuple = DEFAULT_BUCKETS):
+        self.name, self.doc = name, doc
+        self.buckets = tuple(buckets)
+        self._counts = [0] * (len(self.buckets) + 1)
+        self._sum = 0.0
+        self._lock = threading.Lock()
+        _registry.append(self)
+
+    def observe(self, value: float):
+        i = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self._counts[i] += 1
+            self._sum += value
+
+    @contextmanager
+    def time(self):
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - t0)
+
+    def collect(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.doc}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            counts, total = list(self._counts), self._sum
+        acc = 0
+        for bound, n in zip(self.buckets, counts):
+            acc += n
+            lines.append(f'{self.name}_bucket{{le="{bound}"}} {acc}')
+        acc += counts[-1]
+        lines.append(f'{self.name}_bucket{{le="+Inf"}} {acc}')
+        lines.append(f"{self.name}_sum {total}")
+        lines.append(f"{self.name}_count {acc}")
+        return lines
+
+
+class Gauge:
+    """Значение снимается в момент запроса: fn() → число или [(значения меток, число), ...]."""
+
+    def __init__(self, name: str, doc: str, fn, labels: tuple = ()):
+        self.name, self.doc, self.fn, self.labels = name, doc, fn, labels
+        _registry.append(self)
+
+    def collect(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.doc}", f"# TYPE {self.name} gauge"]
+        try:
+            value = self.fn()
+        except Exception as e:
+            return lines + [f"# ошибка сбора: {e}"]
+        samples = value if self.labels else [((), value)]
+        for values, v in samples:
+            lines.append(f"{self.name}{_fmt_labels(self.labels, values)} {v}")
+        return lines
+
+
+def render() -> str:
+    lines = []
+    for metric in _registry:
+        lines.extend(metric.collect())
+    return "\n".join(lines) + "\n"
+
+
+# ── метрики горячих путей ─────────────────────────────────────────────────────
+PARSE_SECONDS = Histogram("bnk_parse_seconds", "Разбор сообщения (build_report)")
+SAVE_SECONDS = Histogram("bnk_save_seconds", "Запись пачки отчётов в хранилище (save_entry/save_entries)")
+SAVE_ROWS = Counter("bnk_saved_rows_total", "Записано отчётов")
+COMPACT_SECONDS = Histogram("bnk_compact_seconds", "Перенос журнала месяца в Excel (пересохранение книги)")
+GRAF_SECONDS = Histogram("bnk_graf_render_seconds", "Построение графиков /graf (без отправки)")
+SEND_SECONDS = Histogram("bnk_send_seconds", "Отправка сообщения в Telegram (Outbox)")
+SEND_ERRORS = Counter("bnk_send_errors_total", "Ошибки отправки сообщений", labels=("kind",))
+ANOMALIES = Counter("bnk_anomalies_total", "Необычные смены, отмеченные в подтверждениях", labels=("series",))
+
+
+# ── HTTP ──────────────────────────────────────────────────────────────────────
+async def _handle(reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+    try:
+        request = await asyncio.wait_for(reader.readuntil(b"\r\n\r\n"), 5)
+        path = request.split(b" ", 2)[1] if request.count(b" ") >= 2 else b""
+        if path.split(b"?", 1)[0] == b"/metrics":
+            # сбор опрашиваемых показателей может читать файлы — не в event loop
+            body = (await asyncio.to_thread(render)).encode()
+            status, ctype = b"200 OK", b"text/plain; version=0.0.4; charset=utf-8"
+        else:
+            body, status, ctype = b"not found\n", b"404 Not Found", b"text/plain"
+        writer.write(
+            b"HTTP/1.1 " + status + b"\r\nContent-Type: " + ctype
+            + b"\r\nContent-Length: " + str(len(body)).encode() + b"\r\nConnection: close\r\n\r\n" + body
+        )
+        await writer.drain()
+    except (asyncio.IncompleteReadError, asyncio.LimitOverrunError, asyncio.TimeoutError, ConnectionError):
+        pass
+    finally:
+        writer.close()
+
+
+async def start_server(port: int, host: str = "0.0.0.0"):
+    """HTTP-сервер с /metrics; возвращает asyncio.Server (закрыть — server.close())."""
+    return await asyncio.start_server(_handle, host, port)
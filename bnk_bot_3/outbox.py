@@ -0,0 +1,198 @@
+import asyncio
+from collections import deque
+
+from telegram.error import BadRequest, NetworkError, RetryAfter, TelegramError
+
+from metrics import SEND_ERRORS, SEND_SECONDS
+
+MAX_MESSAGE_LEN = 4096  # предел длины текста одного сообщения Telegram
+COALESCE_SEPARATOR = "\n\n➖➖➖➖➖\n\n"
+
+
+def pack_texts(items: list[tuple[str, object]], limit: int = MAX_MESSAGE_LEN) -> list[tuple[str, list]]:
+    """
+    Склеивает тексты [(текст, on_sent), ...] через разделитель в как можно меньше
+    сообщений не длиннее limit; у каждого сообщения — колбэки вошедших в него текстов.
+    """
+    parts: list[tuple[str, list]] = []
+    for text, on_sent in items:
+        text = text[:limit]
+        if parts and len(parts[-1][0]) + len(COALESCE_SEPARATOR) + len(text) <= limit:
+            parts[-1] = (parts[-1][0] + COALESCE_SEPARATOR + text, parts[-1][1])
+        else:
+            parts.append((text, []))
+        if on_sent is not None:
+            parts[-1][1].append(on_sent)
+    return parts
+
+
+# ────────────────────────────────────────────────
+# Очередь исходящих сообщений с лимитами Telegram
+# ────────────────────────────────────────────────
+class Outbox:
+    """
+    Все подтверждения отчётов уходят через одну очередь:
+    • не чаще `rate` сообщений в секунду на весь бот;
+    • в один чат — не чаще раза в `private_interval` (личка) / `group_interval` (группа)
+      секунд, сообщения одного чата уходят строго по порядку;
+    • 429 (RetryAfter) — чат и весь бот ждут указанное Telegram время, затем повтор;
+      сетевые ошибки — повтор с экспоненциальной задержкой, до `max_attempts` попыток;
+    • send(..., coalesce=True) — тексты, пришедшие в чат за `coalesce_window` секунд,
+      склеиваются в одно сообщение (пачка подтверждений после сдачи смены);
+    • on_sent() вызывается, когда Telegram принял сообщение (трассировка отчётов).
+    """
+
+    def __init__(self, rate: float = 25.0, private_interval: float = 1.0, group_interval: float = 3.0,
+                 coalesce_window: float = 1.5, max_attempts: int = 5, max_inflight: int = 8):
+        self.rate = rate
+        self.private_interval = private_interval
+        self.group_interval = group_interval
+        self.coalesce_window = coalesce_window
+        self.max_attempts = max_attempts
+        self.max_inflight = max_inflight
+        self._bot = None
+        self._queues: dict[int, deque] = {}      # chat_id → [(kwargs, попытка, колбэки), ...]
+        self._coalescing: dict[int, list[tuple[str, object]]] = {}
+        self._coalesce_timers: dict[int, asyncio.TimerHandle] = {}
+        self._next_at: dict[int, float] = {}     # chat_id → когда можно слать в чат
+        self._global_next = 0.0
+        self._inflight: set[int] = set()         # чаты, куда сейчас идёт отправка
+        self._sending: set[asyncio.Task] = set()
+        self._wakeup: asyncio.Event | None = None
+        self._task: asyncio.Task | None = None
+        self.sent = 0
+        self.dropped = 0
+
+    def start(self, bot):
+        self._bot = bot
+        self._wakeup = asyncio.Event()
+        self._task = asyncio.create_task(self._run())
+
+    def __len__(self) -> int:
+        return sum(len(q) for q in self._queues.values()) + sum(len(t) for t in self._coalescing.values())
+
+    # ── постановка в очередь ─────────────────────────────────────────────────
+    def send(self, chat_id: int, text: str, coalesce: bool = False, on_sent=None, **kwargs):
+        """Ставит сообщение в очередь (не ждёт отправки)."""
+        if coalesce and not kwargs:
+            texts = self._coalescing.setdefault(chat_id, [])
+            texts.append((text, on_sent))
+            if len(texts) == 1:
+                loop = asyncio.get_running_loop()
+                self._coalesce_timers[chat_id] = loop.call_later(self.coalesce_window, self._release, chat_id)
+            return
+        self._enqueue(chat_id, dict(kwargs, text=text), callbacks=[on_sent] if on_sent else [])
+
+    def _release(self, chat_id: int):
+        self._coalesce_timers.pop(chat_id, None)
+        for text, callbacks in pack_texts(self._coalescing.pop(chat_id, [])):
+            self._enqueue(chat_id, {"text": text}, callbacks=callbacks)
+
+    def _enqueue(self, chat_id: int, kwargs: dict, attempt: int = 0, front: bool = False, callbacks: list = ()):
+        queue = self._queues.setdefault(chat_id, deque())
+        if front:
+            queue.appendleft((kwargs, attempt, callbacks))
+        else:
+            queue.append((kwargs, attempt, callbacks))
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    # ── отправка ─────────────────────────────────────────────────────────────
+    def _interval(self, chat_id: int) -> float:
+        return self.group_interval if chat_id < 0 else self.private_interval
+
+    def _pick(self, now: float) -> tuple[int | None, float | None]:
+        """Чат, которому пора слать (или None), и через сколько проверить снова."""
+        best, best_at = None, None
+        for chat_id, queue in self._queues.items():
+            if not queue or chat_id in self._inflight:
+                continue
+            at = self._next_at.get(chat_id, 0.0)
+            if best_at is None or at < best_at:
+                best, best_at = chat_id, at
+        if best is None:
+            return None, None
+        at = max(best_at, self._global_next)
+        return (best, None) if at <= now else (None, at - now)
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            chat_id, wait = (None, None)
+            if len(self._inflight) < self.max_inflight:
+                chat_id, wait = self._pick(loop.time())
+            if chat_id is None:
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), wait)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            now = loop.time()
+            kwargs, attempt, callbacks = self._queues[chat_id].popleft()
+            if not self._queues[chat_id]:
+                del self._queues[chat_id]
+            self._global_next = max(self._global_next, now) + 1.0 / self.rate
+            self._next_at[chat_id] = now + self._interval(chat_id)
+            self._inflight.add(chat_id)
+            task = asyncio.create_task(self._deliver(chat_id, kwargs, attempt, callbacks))
+            self._sending.add(task)
+            task.add_done_callback(self._sending.discard)
+
+    async def _deliver(self, chat_id: int, kwargs: dict, attempt: int, callbacks: list):
+        loop = asyncio.get_running_loop()
+        try:
+            with SEND_SECONDS.time():
+                await self._bot.send_message(chat_id=chat_id, **kwargs)
+            self.sent += 1
+            for on_sent in callbacks:
+                on_sent()
+        except RetryAfter as e:
+            SEND_ERRORS.inc("retry_after")
+            # флуд-контроль: ждём, сколько сказал Telegram, и этот чат, и весь бот
+            resume = loop.time() + float(e.retry_after)
+            self._next_at[chat_id] = resume
+            self._global_next = max(self._global_next, resume)
+            self._enqueue(chat_id, kwargs, attempt, front=True, callbacks=callbacks)
+        except BadRequest as e:  # подкласс NetworkError, но повтор не поможет
+            SEND_ERRORS.inc("bad_request")
+            self.dropped += 1
+            print(f"[WARN] сообщение в чат {chat_id} не отправлено: {e}")
+        except NetworkError as e:
+            SEND_ERRORS.inc("network")
+            if attempt + 1 >= self.max_attempts:
+                self.dropped += 1
+                print(f"[WARN] сообщение в чат {chat_id} не отправлено после {attempt + 1} попыток: {e}")
+            else:
+                self._next_at[chat_id] = loop.time() + min(2 ** attempt, 30)
+                self._enqueue(chat_id, kwargs, attempt + 1, front=True, callbacks=callbacks)
+        except TelegramError as e:  # бот удалён из чата и т.п.
+            SEND_ERRORS.inc("other")
+            self.dropped += 1
+            print(f"[WARN] сообщение в чат {chat_id} не отправлено: {e}")
+        finally:
+            self._inflight.discard(chat_id)
+            self._wakeup.set()
+
+    async def close(self, timeout: float = 10.0):
+        """Остановка: склеенное досылается сразу, очередь дорабатывает не дольше timeout секунд."""
+        for chat_id in list(self._coalescing):
+            timer = self._coalesce_timers.pop(chat_id, None)
+            if timer is not None:
+                timer.cancel()
+            self._release(chat_id)
+
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        while (self._queues or self._sending) and loop.time() < deadline:
+            await asyncio.sleep(0.05)
+        if self._queues:
+            print(f"[WARN] при остановке не отправлено сообщений: {sum(len(q) for q in self._queues.values())}")
+
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
@@ -7,6 +7,13 @@ NUM_RE = re.compile(
     r'(?:[.,]\d+)?)'                               # опциональная дробная часть
 )
 
+# То же, но с числом без знака в группе — для суммирования без lstrip()
+_NUM_BODY_RE = re.compile(
+    r'[-−–—+]?'
+    r'((?:\d{1,3}(?:[ \u00A0]\d{3})+|\d+)'
+    r'(?:[.,]\d+)?)'
+)
+
 # Секции, встреча с которыми должна завершать блок экструзии
 SECTION_STOP_RE = re.compile(
     r'(?:^|\b)(паков|вес|флекс|пакетосвар|окраш|итого|всего)\b',
@@ -23,121 +30,182 @@ def _to_float(s: str) -> float:
 def _sum_numbers_in_line(line: str) -> float:
     """Суммируем все числа в строке, игнорируя любой ведущий знак (−/—/+/-)."""
     total = 0.0
-    for m in NUM_RE.finditer(line):
-        num_str = m.group(0).lstrip(' -−–—+')  # убираем любой ведущий знак
-        if not num_str:
-            continue
+    for num_str in _NUM_BODY_RE.findall(line):  # группа — число без ведущего знака
         total += _to_float(num_str)
     return total
 
-def _extract_number(text: str, patterns: str) -> float:
-    """Сумма первых чисел в строках, где встречается один из patterns."""
-    pat = re.compile(rf'(?:{patterns})', re.IGNORECASE)
-    total = 0.0
-    for raw in text.splitlines():
-        line = raw.strip()
-        if not line:
-            continue
-        if pat.search(line):
-            m = re.search(r'([0-9]{1,3}(?:[ \u00A0]\d{3})+|\d+)(?:[.,]\d+)?', line)
-            if m:
-                total += _to_float(m.group(0))
-    return round(total, 2)
-
-def _parse_extrusion(text: str) -> float:
-    """
-    Экструзия = числа:
-      • в строке с 'экструз'/'экструдер'
-      • + в следующих непустых строках (до 8 вниз, пустые пропускаем),
-        если в строке встречается 'мяг' или 'тв' (поддержаны латинские m/t).
-    Блок обрывается, если встречаем другой раздел (флекса/пакетосварка/окрашено/паков/вес/итого/всего).
-    """
-    lines = [ln.rstrip() for ln in text.splitlines()]
-    total = 0.0
+# ──────────────────────────────────────────────────────────────────────────────
+# Движок разбора: все шаблоны компилируются один раз при импорте модуля
+# ──────────────────────────────────────────────────────────────────────────────
+# Ключевые слова ищутся подстрокой в строке, приведённой к нижнему регистру, —
+# это заметно быстрее регулярных выражений с IGNORECASE на кириллице.
+# Редкие буквы, которые re.IGNORECASE считает равными обычным (ᲀ → в, ᲂ → о, …),
+# а str.lower() — нет, приводим отдельно, чтобы результат не отличался.
+_CASEFIX_RE = re.compile('[\u1c80-\u1c85]')
+_CASEFIX = str.maketrans('\u1c80\u1c81\u1c82\u1c83\u1c84\u1c85', 'вдостт')
+
+# Разрешаем не только начало строки, но и "… мягкие 14 …", "… т 0.9"; поддерживаем латинские m/t
+_SOFT_RE = re.compile(r'(?:^|\W)(мягк\w*|[мm]\b)', re.IGNORECASE)
+_HARD_RE = re.compile(r'(?:^|\W)(тв(?:ёрд|ерд)\w*|тв\.?|[тt]\b)', re.IGNORECASE)
+
+_FIRST_NUM_RE = re.compile(r'([0-9]{1,3}(?:[ \u00A0]\d{3})+|\d+)(?:[.,]\d+)?')
+
+# Сколько непустых строк ниже строки экструзии просматриваем в поисках мяг/тв
+_EXTRU_WINDOW = 8
 
-    extru_re = re.compile(r'(экструз|экструд)', re.IGNORECASE)
-    # Разрешаем не только начало строки, но и "… мягкие 14 …", "… т 0.9"; поддерживаем латинские m/t
-    soft_re  = re.compile(r'(?:^|\W)(мягк\w*|[мm]\b)', re.IGNORECASE)
-    hard_re  = re.compile(r'(?:^|\W)(тв(?:ёрд|ерд)\w*|тв\.?|[тt]\b)', re.IGNORECASE)
-
-    i = 0
-    while i < len(lines):
-        line = lines[i]
-        low = line.lower()
-        if extru_re.search(low) and not SECTION_STOP_RE.search(low):
-            # числа прямо в строке экструзии (если есть)
-            total += _sum_numbers_in_line(line)
-
-            nonempty_seen = 0
-            j = i + 1
-            while j < len(lines) and nonempty_seen < 8:
-                nxt = lines[j]
-                if not nxt.strip():
-                    j += 1
-                    continue  # пустые строки пропускаем
-
-                nonempty_seen += 1
-                nxt_low = nxt.lower()
-
-                # если пошёл другой раздел — выходим из блока
-                if SECTION_STOP_RE.search(nxt_low):
-                    break
-
-                # "мяг"/"тв" — суммируем числа
-                if soft_re.search(nxt_low) or hard_re.search(nxt_low):
-                    total += _sum_numbers_in_line(nxt)
-                    j += 1
-                    continue
-
-                # не мяг/тв и не пусто — это уже другой контент → выходим
-                break
-        i += 1
-
-    return round(total, 2)
 
 def parse_message(text: str) -> dict:
-    """Парсинг отчёта по строкам. Ничего не тянем из несвязанных блоков."""
+    """
+    Парсинг отчёта по строкам за один проход. Ничего не тянем из несвязанных блоков.
+
+    Каждая непустая строка:
+      • добавляет сумму своих чисел ко всем метрикам, чьё ключевое слово в ней есть
+        (Паков / Вес / Пакетосварка / Флекса);
+      • продвигает открытые блоки экструзии: строка экструзии + до 8 непустых строк
+        ниже с мяг/тв (поддержаны латинские m/t). Блок обрывается на другом разделе
+        (флекса/пакетосварка/окрашено/паков/вес/итого/всего) или на любой иной строке.
+    Если блоки экструзии дали 0 — берётся первое число из строки 'экструзия'/'экструдер'.
+    """
+    # Ключевые слова ищем в тексте с Ё→Е, экструзию — в исходном (замена не трогает переносы строк)
     txt = text.replace('Ё', 'Е').replace('ё', 'е')
+    src_lines = text.splitlines()
+    txt_lines = txt.splitlines()
 
-    res = {}
+    pak = ves = paket = flexa = 0.0
+    has_extru = False
+    blocks = []        # [числа блока экструзии по порядку] — суммируются в порядке появления блоков
+    open_blocks = []   # [(просмотрено непустых строк, числа блока)] — ещё принимающие строки
+    fallback = 0.0
+
+    for raw, raw_txt in zip(src_lines, txt_lines):
+        line = raw_txt.strip()
+        if not line:
+            continue  # пустые строки не считаются и в окне экструзии
+
+        key = line.lower()
+        if _CASEFIX_RE.search(key):
+            key = key.translate(_CASEFIX)
+
+        # Паков / Вес / Пакетосварка / Флекса — суммируем ВСЕ числа строки с ключевым словом
+        # ('упаков' покрывается 'паков')
+        line_sum = None
+        if 'паков' in key or 'паки' in key:
+            line_sum = _sum_numbers_in_line(line)
+            pak += line_sum
+        if 'вес' in key:
+            if line_sum is None:
+                line_sum = _sum_numbers_in_line(line)
+            ves += line_sum
+        if 'пакетосвар' in key:
+            if line_sum is None:
+                line_sum = _sum_numbers_in_line(line)
+            paket += line_sum
+        if 'флекс' in key:
+            if line_sum is None:
+                line_sum = _sum_numbers_in_line(line)
+            flexa += line_sum
+
+        is_extru = 'экструз' in key or 'экструд' in key
+        if not open_blocks and not is_extru:
+            continue  # строка не касается экструзии
+
+        low = raw.rstrip().lower()
+        is_stop = SECTION_STOP_RE.search(low) is not None
+
+        if open_blocks:
+            if not is_stop and (_SOFT_RE.search(low) or _HARD_RE.search(low)):
+                if line_sum is None:
+                    line_sum = _sum_numbers_in_line(line)
+                still_open = []
+                for seen, nums in open_blocks:
+                    nums.append(line_sum)
+                    if seen + 1 < _EXTRU_WINDOW:
+                        still_open.append((seen + 1, nums))
+                open_blocks = still_open
+            else:
+                # пошёл другой раздел или иной контент — все блоки закрыты
+                open_blocks = []
+
+        if is_extru:
+            has_extru = True
+            if not is_stop:
+                if line_sum is None:
+                    line_sum = _sum_numbers_in_line(line)
+                nums = [line_sum]
+                blocks.append(nums)
+                open_blocks.append((0, nums))
+
+            # запасной вариант — первое число в строке 'экструзия'/'экструдер'
+            if 'экструзия' in key or 'экструдер' in key:
+                m = _FIRST_NUM_RE.search(line)
+                if m:
+                    fallback += _to_float(m.group(0))
 
-    # Паков / Вес — суммируем ВСЕ числа в строках, где встречается ключевое слово
-    def sum_by_keyword(all_text: str, kw_pattern: str) -> float:
-        total = 0.0
-        kw = re.compile(kw_pattern, re.IGNORECASE)
-        for raw in all_text.splitlines():
-            line = raw.strip()
-            if not line:
-                continue
-            if kw.search(line):
-                total += _sum_numbers_in_line(line)
-        return round(total, 2)
-
-    pak = sum_by_keyword(txt, r'паков|паки|упаков')
-    if pak:
-        res["Паков"] = pak
-
-    ves = sum_by_keyword(txt, r'вес')
-    if ves:
-        res["Вес"] = ves
-
-    paket = sum_by_keyword(txt, r'пакетосвар')
-    if paket:
-        res["Пакетосварка"] = paket
-
-    flexa = sum_by_keyword(txt, r'флекс')
-    if flexa:
-        res["Флекса"] = flexa
-
-    # Экструзия — специальная логика (строка экструзии + до 8 непустых строк ниже с мяг/тв)
-    if re.search(r'(экструз|экструд)', txt, re.IGNORECASE):
-        ext = _parse_extrusion(text)  # исходный текст с переносами
+    res = {}
+    for name, total in (("Паков", pak), ("Вес", ves), ("Пакетосварка", paket), ("Флекса", flexa)):
+        total = round(total, 2)
+        if total:
+            res[name] = total
+
+    if has_extru:
+        ext = 0.0
+        for nums in blocks:
+            for v in nums:
+                ext += v
+        ext = round(ext, 2)
         if ext:
             res["Экструзия"] = ext
         else:
-            # запасной вариант — число в той же строке, где упоминается экструзия/экструдер
-            fallback = _extract_number(txt, r'экструзия|экструдер')
+            fallback = round(fallback, 2)
             if fallback:
                 res["Экструзия"] = fallback
 
     return res
+
+
+# ──────────────────────────────────────────────────────────────────────────────
+# Отчёт целиком: фильтр + разбор + правила приёма (общие для бота и импорта истории)
+# ──────────────────────────────────────────────────────────────────────────────
+REPORT_FIELDS = ["Паков", "Вес", "Пакетосварка", "Флекса", "Экструзия"]
+
+# Фильтр отчёта: в тексте должны быть слова из КАЖДОЙ группы
+_REPORT_KEYWORD_GROUPS = (
+    ("паков", "паки", "упаков"),
+    ("вес",),
+    ("отход",),
+    ("пакетосвар",),
+    ("экструз", "экструд"),
+)
+
+
+def is_valid_report(text: str) -> bool:
+    """Фильтр отчёта: требуем присутствие ключевых слов."""
+    t = text.lower()
+    return all(any(v in t for v in grp) for grp in _REPORT_KEYWORD_GROUPS)
+
+
+def build_report(text: str) -> dict | None:
+    """
+    Разбор отчёта по правилам бота: None, если это не отчёт или в нём меньше 3 непустых полей.
+    Иначе — все поля REPORT_FIELDS (отсутствующие = 0.0) и Итого = Пакетосварка + Флекса + Экструзия.
+    """
+    if not is_valid_report(text):
+        return None
+    return report_values(text)
+
+
+def report_values(text: str) -> dict | None:
+    """build_report() без фильтра ключевых слов — для текста, уже прошедшего is_valid_report()."""
+    values = parse_message(text)
+    if not values:
+        return None
+
+    # минимум 3 непустых поля
+    if sum(1 for v in values.values() if v not in (0, "", None)) < 3:
+        return None
+
+    for key in REPORT_FIELDS:
+        values.setdefault(key, 0.0)
+
+    values["Итого"] = values["Пакетосварка"] + values["Флекса"] + values["Экструзия"]
+    return values
@@ -0,0 +1,155 @@
+import asyncio
+import json
+import os
+from datetime import datetime
+
+
+# ────────────────────────────────────────────────
+# Очередь ожидающих отчётов на диске
+# ────────────────────────────────────────────────
+class PendingStore:
+    """
+    Журнал операций над отчётами, ждущими SAVE_DELAY: строки JSON
+      {"op": "put", "chat": chat_id, "id": message_id, "rec": {...}} — отчёт добавлен/изменён
+      {"op": "del", "chat": chat_id, "id": message_id}               — отчёт сохранён
+    Ключ отчёта — (chat_id, message_id): Telegram нумерует сообщения в каждом чате отдельно.
+    put()/drop() меняют очередь в памяти и только ставят операцию в буфер: фоновая
+    задача дописывает всё, что накопилось за `window` секунд, одной записью и
+    одним fsync в потоке (как журнал отчётов) — event loop диска не ждёт.
+    В записи — только простые данные (чат, имя и ID, значения, время, срок).
+    Мёртвые записи убираются перезаписью файла, когда их становится много.
+    """
+
+    def __init__(self, path: str, window: float = 0.2):
+        self.path = path
+        self.window = window
+        self._live: dict[tuple[int, int], dict] = {}  # (chat_id, message_id) → запись
+        self._ops = 0
+        self._buf: list[dict] = []  # операции, ещё не записанные на диск
+        self._resync = False  # запись не удалась — файл перезаписывается из _live
+        self._io = asyncio.Lock()  # пачки пишутся по очереди, в порядке операций
+        self._wakeup: asyncio.Event | None = None
+        self._task: asyncio.Task | None = None
+        self._closing = False
+
+    def start(self):
+        self._wakeup = asyncio.Event()
+        self._task = asyncio.create_task(self._run())
+
+    @staticmethod
+    def _encode(data: dict, due: float) -> dict:
+        return {
+            "chat_id": data["chat_id"],
+            "user": data["user"],
+            "user_id": data.get("user_id"),
+            "values": data["values"],
+            "time": data["time"].isoformat(),
+            "due": due,
+        }
+
+    def load(self) -> dict[tuple[int, int], tuple[dict, float]]:
+        """
+        Читает очередь после перезапуска: {(chat_id, message_id): (данные для pending_updates, срок epoch)}.
+        Читает и перезаписывает файл — вызывать вне event loop (asyncio.to_thread) до start().
+        """
+        self._live.clear()
+        self._ops = 0
+        if os.path.exists(self.path):
+            with open(self.path, "r", encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        op = json.loads(line)
+                        mid = int(op["id"])
+                        chat = op.get("chat")
+                        if op["op"] == "put":
+                            # в очереди прошлой версии чата в операции нет — он есть в записи
+                            self._live[(int(chat if chat is not None else op["rec"]["chat_id"]), mid)] = op["rec"]
+                        elif chat is not None:
+                            self._live.pop((int(chat), mid), None)
+                        else:
+                            for key in [k for k in self._live if k[1] == mid]:
+                                del self._live[key]
+                    except (ValueError, KeyError, TypeError):
+                        continue  # оборванная при сбое строка
+        self._rewrite(list(self._live.items()))
+        self._ops = len(self._live)
+
+        out = {}
+        for key, rec in self._live.items():
+            data = {
+                "chat_id": rec["chat_id"],
+                "user": rec["user"],
+                "user_id": rec.get("user_id"),  # в очереди прошлой версии ID нет
+                "values": rec["values"],
+                "time": datetime.fromisoformat(rec["time"]),
+            }
+            out[key] = (data, float(rec["due"]))
+        return out
+
+    def put(self, key: tuple[int, int], data: dict, due: float):
+        rec = self._encode(data, due)
+        self._live[key] = rec
+        self._queue({"op": "put", "chat": key[0], "id": key[1], "rec": rec})
+
+    def drop(self, key: tuple[int, int]):
+        if self._live.pop(key, None) is None:
+            return
+        self._queue({"op": "del", "chat": key[0], "id": key[1]})
+
+    def _queue(self, op: dict):
+        self._buf.append(op)
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    async def _run(self):
+        while not self._closing:
+            await self._wakeup.wait()
+            await asyncio.sleep(self.window)  # соседние put/drop — в тот же fsync
+            self._wakeup.clear()
+            await self.flush()
+
+    async def flush(self):
+        """Записывает накопленные операции (или перезаписывает файл, если мёртвых записей много)."""
+        async with self._io:
+            if not self._buf and not self._resync:
+                return
+            ops, self._buf = self._buf, []
+            self._ops += len(ops)
+            snapshot = None
+            if self._resync or self._ops > 2 * len(self._live) + 100:
+                # снимок уже учитывает все операции буфера — их дописывать не нужно
+                snapshot = list(self._live.items())
+                self._ops = len(snapshot)
+                self._resync = False
+            try:
+                await asyncio.to_thread(self._write, ops, snapshot)
+            except OSError as e:
+                print("pending store write error:", e)
+                self._resync = True
+
+    def _write(self, ops: list[dict], snapshot: list | None):
+        if snapshot is not None:
+            self._rewrite(snapshot)
+            return
+        with open(self.path, "a", encoding="utf-8") as f:
+            f.write("".join(json.dumps(op, ensure_ascii=False) + "\n" for op in ops))
+            f.flush()
+            os.fsync(f.fileno())
+
+    def _rewrite(self, items: list):
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            for (chat, mid), rec in items:
+                f.write(json.dumps({"op": "put", "chat": chat, "id": mid, "rec": rec}, ensure_ascii=False) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.path)
+
+    async def close(self):
+        """Дописывает буфер и останавливает фоновую запись."""
+        if self._task is not None:
+            self._closing = True
+            self._wakeup.set()
+            await self._task
+            self._task = None
+        await self.flush()
@@ -0,0 +1,98 @@
+import cProfile
+import functools
+import io
+import pstats
+import time
+import tracemalloc
+from datetime import datetime
+
+
+# ────────────────────────────────────────────────
+# Профилирование по команде (/profile)
+# ────────────────────────────────────────────────
+class Profiler:
+    """
+    Сессия профилирования на заданное время:
+    • cProfile на потоке event loop — все хэндлеры, планировщик, отправка;
+      запись в хранилище и рендер графиков идут в пуле потоков/процессе и видны
+      здесь только как ожидание (их время — в метриках bnk_save_seconds и др.);
+    • tracemalloc — снимки в начале и в конце, разница по строкам кода;
+    • время хэндлеров, обёрнутых в @track (число вызовов, сумма, максимум).
+    Вне сессии @track — одна проверка флага, cProfile и tracemalloc выключены.
+    """
+
+    def __init__(self):
+        self.active = False
+        self.started_at: datetime | None = None
+        self._t0 = 0.0
+        self._profile: cProfile.Profile | None = None
+        self._snapshot: tracemalloc.Snapshot | None = None
+        self._own_tracemalloc = False
+        self._calls: dict[str, list] = {}  # имя → [вызовов, сумма, максимум]
+
+    def track(self, fn):
+        """Декоратор корутины-хэндлера: во время сессии учитывает её вызовы и время."""
+        name = fn.__name__
+
+        @functools.wraps(fn)
+        async def wrapper(*args, **kwargs):
+            if not self.active:
+                return await fn(*args, **kwargs)
+            t0 = time.perf_counter()
+            try:
+                return await fn(*args, **kwargs)
+            finally:
+                dt = time.perf_counter() - t0
+                stat = self._calls.setdefault(name, [0, 0.0, 0.0])
+                stat[0] += 1
+                stat[1] += dt
+                stat[2] = max(stat[2], dt)
+
+        return wrapper
+
+    def start(self):
+        """Начать сессию; вызывать из потока event loop."""
+        self._calls.clear()
+        self._own_tracemalloc = not tracemalloc.is_tracing()
+        if self._own_tracemalloc:
+            tracemalloc.start(10)
+        self._snapshot = tracemalloc.take_snapshot()
+        self._profile = cProfile.Profile()
+        self.started_at = datetime.now()
+        self._t0 = time.perf_counter()
+        self.active = True
+        self._profile.enable()
+
+    def stop(self, top: int = 30) -> str:
+        """Закончить сессию и вернуть текстовый отчёт."""
+        self._profile.disable()
+        self.active = False
+        elapsed = time.perf_counter() - self._t0
+
+        snapshot = tracemalloc.take_snapshot()
+        if self._own_tracemalloc:
+            tracemalloc.stop()
+        mem_diff = snapshot.compare_to(self._snapshot, "lineno")
+        self._snapshot = None
+
+        out = io.StringIO()
+        out.write(f"Профиль BNK-бота: {self.started_at:%Y-%m-%d %H:%M:%S}, {elapsed:.1f} с\n\n")
+
+        out.write("=== Хэндлеры ===\n")
+        if self._calls:
+            out.write(f"{'хэндлер':24s} {'вызовов':>8s} {'сумма, мс':>12s} {'среднее, мс':>12s} {'макс, мс':>10s}\n")
+            for name, (n, total, worst) in sorted(self._calls.items(), key=lambda kv: -kv[1][1]):
+                out.write(f"{name:24s} {n:8d} {total * 1000:12.1f} {total / n * 1000:12.2f} {worst * 1000:10.1f}\n")
+        else:
+            out.write("вызовов не было\n")
+
+        for sort_key, title in (("cumulative", "по суммарному времени"), ("tottime", "по собственному времени")):
+            out.write(f"\n=== Функции {title} (топ {top}) ===\n")
+            stats = pstats.Stats(self._profile, stream=out)
+            stats.strip_dirs().sort_stats(sort_key).print_stats(top)
+
+        out.write(f"\n=== Память: прирост за сессию по строкам (топ {top}) ===\n")
+        for stat in mem_diff[:top]:
+            out.write(f"{stat}\n")
+        self._profile = None
+        return out.getvalue()
@@ -0,0 +1,154 @@
+import json
+import os
+from collections import Counter
+from datetime import datetime
+
+# ──────────────────────────────────────────────────────────────────────────────
+# Свёртка месяца: день × пользователь → суммы метрик и число смен
+# ──────────────────────────────────────────────────────────────────────────────
+# Хранится рядом с данными как YYYY-MM.rollup.json:
+#   {"seq": <последняя учтённая запись журнала>,
+#    "source": [[размер, mtime_ns] | null для Excel, журнала, уплотняемого журнала],
+#    "days": {"YYYY-MM-DD": {"<ключ>": {"Паков": .., ..., "Итого": .., "Смен": n}}},
+#    "names": {"<ключ>": "Имя"}}
+# Ключ пользователя — "id:<Telegram ID>"; у старых строк без колонки ID — само имя.
+# /stats, /graf и старт бота читают только её — их стоимость зависит от числа
+# дней и пользователей, а не от числа отчётов.
+METRICS = ["Паков", "Вес", "Пакетосварка", "Флекса", "Экструзия", "Итого"]
+ID_PREFIX = "id:"
+
+
+def empty_rollup() -> dict:
+    return {"seq": 0, "days": {}, "names": {}}
+
+
+def user_key(user: str, user_id: int | None) -> str:
+    """Ключ пользователя в итогах: по Telegram ID, а для старых записей без ID — по имени."""
+    return f"{ID_PREFIX}{user_id}" if user_id else str(user)
+
+
+def row_user_id(row) -> int | None:
+    """Telegram ID из 9-й колонки строки (в строках старого формата её нет)."""
+    if len(row) < 9 or row[8] in (None, ""):
+        return None
+    try:
+        return int(row[8])
+    except (ValueError, TypeError):
+        return None
+
+
+def _empty_cell() -> dict:
+    cell = {k: 0.0 for k in METRICS}
+    cell["Смен"] = 0
+    return cell
+
+
+def _num(v) -> float:
+    try:
+        return float(v or 0)
+    except (ValueError, TypeError):
+        return 0.0
+
+
+def _day_of(value) -> str | None:
+    if isinstance(value, datetime):
+        return value.strftime('%Y-%m-%d')
+    if isinstance(value, str) and len(value) >= 10:
+        return value[:10]
+    return None
+
+
+def add_rows(rollup: dict, rows) -> dict:
+    """Добавляет строки формата Excel (Дата, Имя, Паков, …, Итого[, ID]) в свёртку."""
+    days = rollup["days"]
+    names = rollup.setdefault("names", {})
+    for row in rows:
+        date_cell, user = row[0], row[1]
+        if not user:
+            continue
+        day = _day_of(date_cell)
+        if day is None:
+            continue
+        key = user_key(user, row_user_id(row))
+        names[key] = str(user)  # последнее имя пользователя
+        cell = days.setdefault(day, {}).setdefault(key, _empty_cell())
+        for k, v in zip(METRICS, row[2:8]):
+            cell[k] += _num(v)
+        cell["Смен"] += 1
+    return rollup
+
+
+def load_rollup(path: str) -> dict | None:
+    if not os.path.exists(path):
+        return None
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        if "days" not in data:
+            return None
+        data.setdefault("seq", 0)
+        data.setdefault("names", {})
+        return data
+    except (ValueError, OSError):
+        return None
+
+
+def save_rollup(path: str, rollup: dict):
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(rollup, f, ensure_ascii=False, separators=(",", ":"))
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+def key_totals(rollup: dict) -> tuple[dict, dict]:
+    """Итоги по ключам пользователей и имена: ({ключ: ячейка}, {ключ: имя})."""
+    out: dict[str, dict] = {}
+    for users in rollup["days"].values():
+        for key, cell in users.items():
+            acc = out.setdefault(key, _empty_cell())
+            for k in METRICS:
+                acc[k] += cell.get(k, 0.0)
+            acc["Смен"] += int(cell.get("Смен", 0))
+    return out, dict(rollup.get("names", {}))
+
+
+def display_totals(totals: dict, names: dict) -> dict:
+    """
+    Итоги по ключам → формат user_stats (по отображаемым именам).
+    Тёзки с разными ID различаются приписанным ID; записи без ID (старый формат)
+    присоединяются к единственному пользователю с тем же именем.
+    """
+    labels = {key: names.get(key, key) for key in totals}
+    by_id = Counter(label for key, label in labels.items() if key.startswith(ID_PREFIX))
+    out: dict[str, dict] = {}
+    for key, cell in totals.items():
+        label = labels[key]
+        if key.startswith(ID_PREFIX) and by_id[label] > 1:
+            label = f"{label} ({key[len(ID_PREFIX):]})"
+        acc = out.get(label)
+        if acc is None:
+            out[label] = dict(cell)
+        else:
+            for k in acc:
+                acc[k] += cell.get(k, 0)
+    return out
+
+
+def user_totals(rollup: dict) -> dict:
+    """Итоги по пользователям в формате user_stats."""
+    return display_totals(*key_totals(rollup))
+
+
+def daily_totals(rollup: dict) -> list[tuple[str, float, float]]:
+    """[(YYYY-MM-DD, Вес, Итого), ...] по возрастанию даты."""
+    out = []
+    for day in sorted(rollup["days"]):
+        users = rollup["days"][day]
+        out.append((
+            day,
+            sum(c.get("Вес", 0.0) for c in users.values()),
+            sum(c.get("Итого", 0.0) for c in users.values()),
+        ))
+    return out
@@ -4,5 +4,19 @@ set -euo pipefail
 # Читаем опции из /data/options.json (HA сам кладёт туда значения из UI)
 export TELEGRAM_TOKEN="$(jq -r '(.TELEGRAM_TOKEN // "")' /data/options.json)"
 export ALLOWED_USER_IDS="$(jq -r '(.ALLOWED_USER_IDS // "")' /data/options.json)"
+export STORAGE_BACKEND="$(jq -r '(.STORAGE_BACKEND // "excel")' /data/options.json)"
+export UPDATE_MODE="$(jq -r '(.UPDATE_MODE // "polling")' /data/options.json)"
+export WEBHOOK_PORT="$(jq -r '(.WEBHOOK_PORT // "8443")' /data/options.json)"
+export WEBHOOK_PATH="$(jq -r '(.WEBHOOK_PATH // "bnk_bot")' /data/options.json)"
+export WEBHOOK_SECRET="$(jq -r '(.WEBHOOK_SECRET // "")' /data/options.json)"
+export WEBHOOK_URL="$(jq -r '(.WEBHOOK_URL // "")' /data/options.json)"
+export BOT_API_URL="$(jq -r '(.BOT_API_URL // "")' /data/options.json)"
+export BOT_API_POOL_SIZE="$(jq -r '(.BOT_API_POOL_SIZE // "16")' /data/options.json)"
+export METRICS_PORT="$(jq -r '(.METRICS_PORT // "0")' /data/options.json)"
+export MAX_CONCURRENT_UPDATES="$(jq -r '(.MAX_CONCURRENT_UPDATES // "16")' /data/options.json)"
+export CHAT_PARTITIONS="$(jq -r '(.CHAT_PARTITIONS // false)' /data/options.json)"
+export PRIMARY_CHAT_ID="$(jq -r '(.PRIMARY_CHAT_ID // "0")' /data/options.json)"
+export ANOMALY_THRESHOLD="$(jq -r '(.ANOMALY_THRESHOLD // "3")' /data/options.json)"
+export ANOMALY_WARMUP="$(jq -r '(.ANOMALY_WARMUP // "10")' /data/options.json)"
 
-exec python3 -u /app/main.py
+exec python3 -u /app/bot.py
@@ -0,0 +1,95 @@
+import asyncio
+import heapq
+import itertools
+from typing import Awaitable, Callable, Hashable
+
+
+# ────────────────────────────────────────────────
+# Планировщик отложенных сохранений (debounce)
+# ────────────────────────────────────────────────
+class DeadlineScheduler:
+    """
+    Одна фоновая задача и куча дедлайнов вместо отдельной спящей задачи на каждый отчёт.
+    • schedule(key, delay) — поставить или ПЕРЕНЕСТИ дедлайн ключа (O(log n));
+    • cancel(key)          — снять ключ;
+    • все ключи, чей срок наступил (или наступит в пределах `slack` секунд),
+      отдаются в flush(keys) одной пачкой.
+    Перенесённые дедлайны не удаляются из кучи сразу: устаревшие записи
+    пропускаются при извлечении, а куча изредка пересобирается.
+    """
+
+    def __init__(self, flush: Callable[[list], Awaitable[None]], slack: float = 1.0):
+        self._flush = flush
+        self.slack = slack
+        self._heap: list[tuple[float, int, Hashable]] = []
+        self._deadlines: dict[Hashable, float] = {}
+        self._counter = itertools.count()
+        self._wakeup: asyncio.Event | None = None
+        self._task: asyncio.Task | None = None
+        self._flushing: set[asyncio.Task] = set()
+
+    def start(self):
+        self._wakeup = asyncio.Event()
+        self._task = asyncio.create_task(self._run())
+
+    def __len__(self) -> int:
+        return len(self._deadlines)
+
+    def __contains__(self, key) -> bool:
+        return key in self._deadlines
+
+    def schedule(self, key: Hashable, delay: float):
+        deadline = asyncio.get_running_loop().time() + delay
+        self._deadlines[key] = deadline
+        heapq.heappush(self._heap, (deadline, next(self._counter), key))
+        if len(self._heap) > 2 * len(self._deadlines) + 64:
+            self._compact()
+        if self._wakeup is not None and self._heap[0][2] == key:
+            self._wakeup.set()  # новый ближайший срок — перевести будильник
+
+    def cancel(self, key: Hashable):
+        self._deadlines.pop(key, None)
+
+    def _compact(self):
+        self._heap = [e for e in self._heap if self._deadlines.get(e[2]) == e[0]]
+        heapq.heapify(self._heap)
+
+    def _pop_due(self, now: float) -> list:
+        due = []
+        while self._heap and self._heap[0][0] <= now:
+            deadline, _, key = heapq.heappop(self._heap)
+            if self._deadlines.get(key) == deadline:  # не перенесён и не снят
+                del self._deadlines[key]
+                due.append(key)
+        return due
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            due = self._pop_due(loop.time() + self.slack)
+            if due:
+                task = asyncio.create_task(self._flush(due))
+                self._flushing.add(task)
+                task.add_done_callback(self._flushing.discard)
+
+            # спим до ближайшего актуального дедлайна или до нового schedule()
+            while self._heap and self._deadlines.get(self._heap[0][2]) != self._heap[0][0]:
+                heapq.heappop(self._heap)
+            timeout = max(self._heap[0][0] - self.slack - loop.time(), 0) if self._heap else None
+            self._wakeup.clear()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+
+    async def close(self):
+        """Останавливает таймер и дожидается уже запущенных пачек."""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self._flushing:
+            await asyncio.gather(*self._flushing, return_exceptions=True)
@@ -0,0 +1,256 @@
+import os
+import sqlite3
+import threading
+from datetime import datetime
+
+import rollup
+from excel_store import HEADER, make_row
+
+# ──────────────────────────────────────────────────────────────────────────────
+# Хранилище «SQLite»: одна база reports.db (WAL), Excel — только по запросу
+# ──────────────────────────────────────────────────────────────────────────────
+# Отчёты пишутся строками таблицы reports подготовленным INSERT, пакет — одной
+# транзакцией. Итоги /stats и /graf считаются GROUP BY по индексам (ym, user)
+# и (ym, day), без свёрток и без чтения Excel. Пользователь в итогах — по
+# user_id (Telegram ID); строки без него (старые данные) — по имени. Excel месяца собирается из SQL
+# только для /csv и /import YYYY-MM и переиспользуется, пока версия месяца
+# не изменилась.
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS reports (
+    id     INTEGER PRIMARY KEY,
+    ym     TEXT NOT NULL,
+    day    TEXT NOT NULL,
+    ts     TEXT NOT NULL,
+    user   TEXT NOT NULL,
+    pakov  REAL NOT NULL DEFAULT 0,
+    ves    REAL NOT NULL DEFAULT 0,
+    paket  REAL NOT NULL DEFAULT 0,
+    flexa  REAL NOT NULL DEFAULT 0,
+    extru  REAL NOT NULL DEFAULT 0,
+    itogo  REAL NOT NULL DEFAULT 0,
+    user_id INTEGER
+);
+CREATE INDEX IF NOT EXISTS reports_ym_day ON reports (ym, day);
+CREATE INDEX IF NOT EXISTS reports_ym_user ON reports (ym, user);
+CREATE TABLE IF NOT EXISTS months (
+    ym      TEXT PRIMARY KEY,
+    version INTEGER NOT NULL DEFAULT 0
+);
+"""
+
+_INSERT_SQL = (
+    "INSERT INTO reports (ym, day, ts, user, pakov, ves, paket, flexa, extru, itogo, user_id) "
+    "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)"
+)
+_BUMP_SQL = (
+    "INSERT INTO months (ym, version) VALUES (?, 1) "
+    "ON CONFLICT (ym) DO UPDATE SET version = version + 1"
+)
+_COLUMNS = "ts, user, pakov, ves, paket, flexa, extru, itogo, user_id"
+# тот же ключ, что rollup.user_key()
+_USER_KEY = f"CASE WHEN user_id IS NULL THEN user ELSE '{rollup.ID_PREFIX}' || user_id END"
+_SUMS = "SUM(pakov), SUM(ves), SUM(paket), SUM(flexa), SUM(extru), SUM(itogo)"
+
+
+def _params(row: list) -> tuple:
+    """Строка формата Excel → параметры INSERT (ym и day берутся из даты строки)."""
+    ts = row[0].strftime('%Y-%m-%d %H:%M') if isinstance(row[0], datetime) else str(row[0])
+    return (ts[:7], ts[:10], ts, str(row[1]), *(rollup._num(v) for v in row[2:8]), rollup.row_user_id(row))
+
+
+class SqliteStorage:
+    """
+    Файлы в каталоге root:
+      reports.db         — база отчётов (+ reports.db-wal, reports.db-shm);
+      export/YYYY-MM.xlsx — Excel месяца, собранный из базы для отправки.
+    Одно соединение на процесс; запросы к нему идут под общей блокировкой
+    (запись — короткие транзакции, чтение — агрегаты по индексу).
+    """
+
+    name = "sqlite"
+
+    def __init__(self, root: str):
+        self.root = root
+        self.db_path = os.path.join(root, "reports.db")
+        self.export_dir = os.path.join(root, "export")
+        os.makedirs(self.export_dir, exist_ok=True)
+
+        fresh = not os.path.exists(self.db_path)
+        self._lock = threading.Lock()
+        self._exported: dict[str, int] = {}
+        self._locks_guard = threading.Lock()
+        self._export_locks: dict[str, threading.Lock] = {}  # ym → одна выгрузка месяца за раз
+        self._conn = sqlite3.connect(self.db_path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=FULL")  # отчёт подтверждается только после fsync
+        self._conn.executescript(_SCHEMA)
+        if "user_id" not in {r[1] for r in self._conn.execute("PRAGMA table_info(reports)")}:
+            self._conn.execute("ALTER TABLE reports ADD COLUMN user_id INTEGER")  # база до колонки ID
+        if fresh:
+            self._migrate_excel()
+
+    def _migrate_excel(self):
+        """Первый запуск на SQLite: переносим данные, накопленные в режиме Excel."""
+        from excel_store import ExcelStorage
+
+        excel = ExcelStorage(self.root)
+        for ym in excel.months():
+            rows = excel.iter_rows(ym)
+            if rows:
+                self._insert(rows)
+                print(f"SQLite: перенесено из Excel {ym}: {len(rows)} записей")
+
+    # ── запись ───────────────────────────────────────────────────────────────
+    def _insert(self, rows: list[list]):
+        params = [_params(row) for row in rows if row and row[1]]
+        if not params:
+            return
+        with self._lock:
+            cur = self._conn.cursor()
+            cur.execute("BEGIN IMMEDIATE")
+            try:
+                cur.executemany(_INSERT_SQL, params)
+                cur.executemany(_BUMP_SQL, [(ym,) for ym in {p[0] for p in params}])
+                cur.execute("COMMIT")
+            except BaseException:
+                cur.execute("ROLLBACK")
+                raise
+
+    def append(self, entries: list[tuple]):
+        """Пакетная запись: [(date, user, values[, user_id]), ...] — одна транзакция и один fsync."""
+        self._insert([make_row(*entry) for entry in entries])
+
+    # ── версия данных ────────────────────────────────────────────────────────
+    def month_version(self, ym: str) -> int:
+        with self._lock:
+            row = self._conn.execute("SELECT version FROM months WHERE ym = ?", (ym,)).fetchone()
+        return row[0] if row else 0
+
+    # ── агрегаты ─────────────────────────────────────────────────────────────
+    def key_totals(self, ym: str) -> tuple[dict, dict]:
+        """
+        Итоги месяца по ключам пользователей и их имена; порядок — по первому отчёту.
+        Имя — из последнего отчёта пользователя (выборка по первичному ключу).
+        """
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT {_USER_KEY} AS k, MAX(id), {_SUMS}, COUNT(*) FROM reports WHERE ym = ? "
+                "GROUP BY k ORDER BY MIN(id)",
+                (ym,),
+            ).fetchall()
+            last_ids = [row[1] for row in rows]
+            last_names = {}
+            for i in range(0, len(last_ids), 500):  # предел числа параметров SQLite
+                chunk = last_ids[i:i + 500]
+                last_names.update(self._conn.execute(
+                    f"SELECT id, user FROM reports WHERE id IN ({','.join('?' * len(chunk))})", chunk
+                ))
+        totals, names = {}, {}
+        for key, last_id, *sums, shifts in rows:
+            totals[key] = dict(zip(rollup.METRICS, (float(s or 0) for s in sums)))
+            totals[key]["Смен"] = shifts
+            names[key] = last_names.get(last_id, key)
+        return totals, names
+
+    def user_totals(self, ym: str) -> dict:
+        """Итоги месяца по пользователям (формат user_stats)."""
+        return rollup.display_totals(*self.key_totals(ym))
+
+    def daily_totals(self, ym: str) -> list[tuple[str, float, float]]:
+        """[(YYYY-MM-DD, Вес, Итого), ...] по возрастанию даты."""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT day, SUM(ves), SUM(itogo) FROM reports WHERE ym = ? GROUP BY day ORDER BY day",
+                (ym,),
+            ).fetchall()
+        return [(day, float(ves or 0), float(itogo or 0)) for day, ves, itogo in rows]
+
+    def months(self) -> list[str]:
+        with self._lock:
+            return [r[0] for r in self._conn.execute("SELECT DISTINCT ym FROM reports ORDER BY ym")]
+
+    # ── Excel по запросу ─────────────────────────────────────────────────────
+    def month_file(self, ym: str) -> str:
+        return os.path.join(self.export_dir, f"{ym}.xlsx")
+
+    def month_files(self, ym: str) -> dict[str, str]:
+        """Файлы, чей размер стоит отслеживать (метрики): выгрузка месяца и общая база."""
+        return {"xlsx": self.month_file(ym), "db": self.db_path, "wal": self.db_path + "-wal"}
+
+    def _export_lock(self, ym: str) -> threading.Lock:
+        with self._locks_guard:
+            lock = self._export_locks.get(ym)
+            if lock is None:
+                lock = self._export_locks[ym] = threading.Lock()
+            return lock
+
+    def export_month(self, ym: str) -> str:
+        """
+        Собирает Excel месяца из базы (write_only, потоково) и возвращает путь.
+        Если версия месяца не менялась с прошлой выгрузки — отдаёт готовый файл.
+        Если данных за месяц нет — файл не создаётся, путь всё равно вернётся.
+        Выгрузки одного месяца идут по очереди (/csv из двух чатов цеха сразу):
+        общий .tmp не пишут два потока, а второй получает уже готовый файл.
+        """
+        with self._export_lock(ym):
+            return self._export_month(ym)
+
+    def _export_month(self, ym: str) -> str:
+        file_path = self.month_file(ym)
+        version = self.month_version(ym)
+        if self._exported.get(ym) == version and os.path.exists(file_path):
+            return file_path
+        if version == 0:
+            return file_path
+
+        from openpyxl import Workbook
+
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT {_COLUMNS} FROM reports WHERE ym = ? ORDER BY id", (ym,)
+            ).fetchall()
+        if not rows:
+            if os.path.exists(file_path):
+                os.remove(file_path)
+            return file_path
+
+        wb = Workbook(write_only=True)
+        ws = wb.create_sheet()
+        ws.append(HEADER)
+        for row in rows:
+            ws.append(row)
+        tmp_path = file_path + ".tmp"
+        wb.save(tmp_path)
+        os.replace(tmp_path, file_path)
+        self._exported[ym] = version
+        return file_path
+
+    def settle(self, ym: str):
+        """Данные уже в базе — доводить нечего."""
+
+    def maintain(self):
+        """Переносит WAL в основной файл базы и обновляет статистику планировщика."""
+        with self._lock:
+            self._conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+            self._conn.execute("PRAGMA optimize")
+
+    def delete_month(self, ym: str):
+        with self._lock:
+            cur = self._conn.cursor()
+            cur.execute("BEGIN IMMEDIATE")
+            try:
+                cur.execute("DELETE FROM reports WHERE ym = ?", (ym,))
+                cur.execute(_BUMP_SQL, (ym,))
+                cur.execute("COMMIT")
+            except BaseException:
+                cur.execute("ROLLBACK")
+                raise
+        with self._export_lock(ym):
+            file_path = self.month_file(ym)
+            if os.path.exists(file_path):
+                os.remove(file_path)
+            self._exported.pop(ym, None)
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,137 @@
+import math
+import time
+from collections import OrderedDict, deque
+
+# ──────────────────────────────────────────────────────────────────────────────
+# Трассировка отчётов: где пропало время между сообщением и подтверждением
+# ──────────────────────────────────────────────────────────────────────────────
+# Метки (perf_counter) ставятся по ходу отчёта:
+#   received → valid (is_valid_report) → parsed (parse_message) → queued
+#   (в pending_updates) → [edited …] → due (срок SAVE_DELAY) → saved (запись
+#   в хранилище) → sent (Telegram принял подтверждение).
+# Открытая трасса — по ключу (chat_id, message_id): номера сообщений у каждого
+# чата свои. Открытые трассы — не больше capacity (старые вытесняются), завершённые —
+# в кольцевом буфере на capacity штук: память не растёт.
+
+# (этап, от метки, до метки)
+STAGES = [
+    ("фильтр", "received", "valid"),
+    ("разбор", "valid", "parsed"),
+    ("в очередь", "parsed", "queued"),
+    ("ожидание", "queued", "due"),
+    ("после правки", "edited", "due"),  # только у правленых: правка заново запускает SAVE_DELAY
+    ("запись", "due", "saved"),
+    ("отправка", "saved", "sent"),
+    ("итого", "received", "sent"),
+]
+
+
+class Trace:
+    __slots__ = ("message_id", "user", "delivery", "marks", "edits")
+
+    def __init__(self, sent_epoch: float | None = None):
+        self.message_id = None
+        self.user = ""
+        # Telegram → бот: дата сообщения с точностью до секунды, поэтому отдельно от этапов
+        self.delivery = max(time.time() - sent_epoch, 0.0) if sent_epoch else None
+        self.marks: dict[str, float] = {"received": time.perf_counter()}
+        self.edits = 0
+
+    def mark(self, stage: str):
+        self.marks[stage] = time.perf_counter()
+
+    def durations(self) -> dict[str, float]:
+        out = {}
+        for name, a, b in STAGES:
+            if a in self.marks and b in self.marks:
+                out[name] = self.marks[b] - self.marks[a]
+        return out
+
+
+def _percentile(sorted_values: list[float], q: float) -> float:
+    """Перцентиль по ближайшему рангу (q — доля 0..1)."""
+    rank = max(1, math.ceil(q * len(sorted_values)))
+    return sorted_values[min(rank, len(sorted_values)) - 1]
+
+
+def _fmt(seconds: float) -> str:
+    if seconds < 1:
+        return f"{seconds * 1000:.1f} мс"
+    return f"{seconds:.1f} с"
+
+
+class TraceBuffer:
+    def __init__(self, capacity: int = 1000):
+        self.capacity = capacity
+        self._open: OrderedDict[tuple[int, int], Trace] = OrderedDict()
+        self._done: deque[Trace] = deque(maxlen=capacity)
+
+    def begin(self, sent_epoch: float | None = None) -> Trace:
+        """Новая трасса с меткой received; в буфер попадёт только после open()."""
+        return Trace(sent_epoch)
+
+    def open(self, key: tuple[int, int], trace: Trace, user: str):
+        trace.message_id = key[1]
+        trace.user = user
+        self._open[key] = trace
+        self._open.move_to_end(key)
+        while len(self._open) > self.capacity:
+            self._open.popitem(last=False)
+
+    def mark(self, key: tuple[int, int], stage: str):
+        trace = self._open.get(key)
+        if trace is not None:
+            if stage == "edited":
+                trace.edits += 1
+            trace.mark(stage)
+
+    def finish(self, key: tuple[int, int], stage: str = "sent"):
+        trace = self._open.pop(key, None)
+        if trace is not None:
+            trace.mark(stage)
+            self._done.append(trace)
+
+    def __len__(self) -> int:
+        return len(self._done)
+
+    def report(self, slowest: int = 5) -> str:
+        """Текст для /latency: p50/p95/p99 по этапам и самые медленные отчёты."""
+        traces = list(self._done)
+        if not traces:
+            return "⏱ Завершённых отчётов пока нет."
+
+        lines = [f"⏱ Задержки по этапам (последние {len(traces)} отчётов):", ""]
+        per_stage: dict[str, list[float]] = {name: [] for name, _a, _b in STAGES}
+        delivery = []
+        for trace in traces:
+            for name, value in trace.durations().items():
+                per_stage[name].append(value)
+            if trace.delivery is not None:
+                delivery.append(trace.delivery)
+
+        rows = [("Telegram→бот", sorted(delivery))] + [(name, sorted(v)) for name, v in per_stage.items()]
+        for name, values in rows:
+            if not values:
+                continue
+            lines.append(
+                f"{name}: p50 {_fmt(_percentile(values, 0.50))} · p95 {_fmt(_percentile(values, 0.95))}"
+                f" · p99 {_fmt(_percentile(values, 0.99))}"
+            )
+        edited = [trace.edits for trace in traces if trace.edits]
+        if edited:
+            lines.append(f"правлено отчётов: {len(edited)} из {len(traces)}, правок всего {sum(edited)}")
+
+        lines += ["", "🐢 Самые медленные (от сообщения до подтверждения):"]
+        ranked = sorted(traces, key=lambda t: t.durations().get("итого", 0.0), reverse=True)[:slowest]
+        for trace in ranked:
+            d = trace.durations()
+            # ожидание SAVE_DELAY длинное по замыслу — ищем худший из остальных этапов
+            stages = {k: v for k, v in d.items() if k not in ("итого", "ожидание", "после правки")}
+            worst = max(stages, key=stages.get) if stages else "—"
+            edits = f", правок {trace.edits}" if trace.edits else ""
+            lines.append(
+                f"• {trace.user} #{trace.message_id}: {_fmt(d.get('итого', 0.0))}"
+                f" (ожидание {_fmt(d.get('ожидание', 0.0))}{edits};"
+                f" дольше остальных — {worst} {_fmt(stages.get(worst, 0.0))})"
+            )
+        return "\n".join(lines)
@@ -0,0 +1,82 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+from data_utils import save_entries
+
+
+# ────────────────────────────────────────────────
+# Фоновый писатель отчётов (group commit)
+# ────────────────────────────────────────────────
+class ReportWriter:
+    """
+    Очередь отчётов, которую разбирает одна фоновая задача.
+    Всё, что пришло за окно `window` секунд, пишется одним вызовом save_entries()
+    на раздел (цех) в отдельном потоке — event loop при этом продолжает обрабатывать
+    апдейты. Разделы пишутся параллельно (до `workers` сразу): у каждого свои файлы
+    и блокировки, цеха друг друга не ждут.
+    """
+
+    def __init__(self, window: float = 0.5, workers: int = 4):
+        self.window = window
+        self._queue: asyncio.Queue | None = None
+        self._task: asyncio.Task | None = None
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="bnk-writer")
+
+    def start(self):
+        self._queue = asyncio.Queue()
+        self._task = asyncio.create_task(self._run())
+
+    async def submit(self, date: datetime, user: str, values: dict, user_id: int | None = None,
+                     partition: str | None = None):
+        """Ставит отчёт в очередь раздела и ждёт, пока пачка с ним будет записана."""
+        fut = asyncio.get_running_loop().create_future()
+        await self._queue.put(((date, user, values, user_id), partition, fut))
+        await fut
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        stop = False
+        while not stop:
+            item = await self._queue.get()
+            if item is None:
+                return
+            batch = [item]
+            # даём соседним отчётам (конец смены) собраться в ту же пачку
+            await asyncio.sleep(self.window)
+            while not self._queue.empty():
+                item = self._queue.get_nowait()
+                if item is None:
+                    stop = True
+                    continue
+                batch.append(item)
+
+            await self._commit(loop, batch)
+
+    async def _commit(self, loop, batch):
+        by_partition: dict[str | None, list] = {}
+        for entry, partition, fut in batch:
+            by_partition.setdefault(partition, []).append((entry, fut))
+        await asyncio.gather(*(
+            self._commit_partition(loop, partition, items) for partition, items in by_partition.items()
+        ))
+
+    async def _commit_partition(self, loop, partition, items):
+        try:
+            await loop.run_in_executor(self._executor, save_entries, [entry for entry, _ in items], partition)
+        except Exception as e:
+            for _, fut in items:
+                if not fut.done():
+                    fut.set_exception(e)
+        else:
+            for _, fut in items:
+                if not fut.done():
+                    fut.set_result(None)
+
+    async def close(self):
+        """Дописывает всё, что осталось в очереди, и останавливает писателя."""
+        if self._task is not None:
+            await self._queue.put(None)
+            await self._task
+            self._task = None
+        self._executor.shutdown(wait=True)